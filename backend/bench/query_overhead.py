@@ -0,0 +1,73 @@
+"""
+Per-call overhead of the hot auth/membership statements: legacy db.query(...)
+construction against the cached statements in services/queries.py.
+
+    cd backend && python bench/query_overhead.py [--calls 5000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from database import SessionLocal, create_schema  # noqa: E402
+from models.users import User, Room, RoomMember  # noqa: E402
+from services import queries  # noqa: E402
+
+
+def bench(label, fn, calls):
+    for _ in range(200):
+        fn()
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    per_call = (time.perf_counter() - started) * 1e6 / calls
+    print(f"{label:28s} {per_call:7.1f} us/call")
+    return per_call
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    create_schema()
+    db = SessionLocal()
+    db.add_all([User(email=f"u{i}@x.com", name="n", password="x") for i in range(100)])
+    db.commit()
+    room = Room(name="r", code="ABC123", created_by=1)
+    db.add(room)
+    db.commit()
+    db.add(RoomMember(room_id=room.id, user_id=5))
+    db.commit()
+    room_id = room.id
+
+    cases = [
+        (
+            "user by email",
+            lambda: db.query(User).filter(User.email == "u50@x.com").first(),
+            lambda: queries.get_user_by_email(db, "u50@x.com"),
+        ),
+        (
+            "membership probe",
+            lambda: db.query(RoomMember).filter(RoomMember.room_id == room_id, RoomMember.user_id == 5).first(),
+            lambda: queries.get_membership(db, room_id, 5),
+        ),
+        (
+            "room by code",
+            lambda: db.query(Room).filter(Room.code == "ABC123", Room.deleted_at.is_(None)).first(),
+            lambda: queries.get_room_by_code(db, "ABC123"),
+        ),
+    ]
+    for label, legacy, cached in cases:
+        before = bench(f"{label} (Query)", legacy, args.calls)
+        after = bench(f"{label} (cached)", cached, args.calls)
+        print(f"{'':28s} {before - after:7.1f} us/call saved ({before / after:.2f}x)")
+    db.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,106 @@
+"""
+CPU per response for a room with 1k members: the original ORM path (room.__dict__
++ response_model validation + stdlib JSON) against the current Core-select +
+orjson path, both served through the same TestClient.
+
+    cd backend && python bench/room_serialization.py [members] [--requests 30]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("JWTSECRET", "bench")
+os.environ.setdefault("REFRESHJWTSECRET", "bench-refresh")
+
+from fastapi import Depends, FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import main  # noqa: E402
+from database import SessionLocal, create_schema, get_db  # noqa: E402
+from models.users import User, Room, RoomMember  # noqa: E402
+from schemas.room import RoomWithMembersResponse  # noqa: E402
+from security.JWTtoken import create_access_token  # noqa: E402
+from security.oauth2 import get_current_user  # noqa: E402
+
+legacy_app = FastAPI()
+
+
+@legacy_app.get("/rooms/{room_id}", response_model=RoomWithMembersResponse)
+def legacy_room_details(room_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """get_room_details as it was before the lean read path"""
+    membership = db.query(RoomMember).filter(
+        RoomMember.room_id == room_id, RoomMember.user_id == current_user.id
+    ).first()
+    assert membership is not None
+    room = db.query(Room).filter(Room.id == room_id).first()
+    members = db.query(RoomMember, User).join(User, RoomMember.user_id == User.id).filter(
+        RoomMember.room_id == room_id
+    ).all()
+    member_responses = [
+        {
+            "id": member.id,
+            "user_id": user.id,
+            "user_name": user.name,
+            "user_email": user.email,
+            "role": member.role,
+            "joined_at": member.joined_at,
+        }
+        for member, user in members
+    ]
+    creator = db.query(User).filter(User.id == room.created_by).first()
+    return {**room.__dict__, "members": member_responses, "creator_name": creator.name if creator else "Unknown"}
+
+
+def seed(members):
+    create_schema()
+    db = SessionLocal()
+    try:
+        users = [User(email=f"u{i}@x.com", name=f"User {i}", password="x", role="Verified Email") for i in range(members)]
+        db.add_all(users)
+        db.commit()
+        room = Room(name="Big", code="BIG001", created_by=users[0].id, max_members=members)
+        db.add(room)
+        db.commit()
+        db.add_all([
+            RoomMember(room_id=room.id, user_id=user.id, role="owner" if i == 0 else "member")
+            for i, user in enumerate(users)
+        ])
+        db.commit()
+        return room.id, users[0].email
+    finally:
+        db.close()
+
+
+def cpu_per_response(client, path, headers, requests):
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    started = time.process_time()
+    for _ in range(requests):
+        client.get(path, headers=headers)
+    return (time.process_time() - started) * 1000 / requests, len(response.content)
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("members", type=int, nargs="?", default=1000)
+    parser.add_argument("--requests", type=int, default=30)
+    args = parser.parse_args()
+
+    room_id, email = seed(args.members)
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": email}), "Accept-Encoding": "identity"}
+
+    before, before_bytes = cpu_per_response(TestClient(legacy_app), f"/rooms/{room_id}", headers, args.requests)
+    after, after_bytes = cpu_per_response(TestClient(main.app), f"/api/rooms/rooms/{room_id}", headers, args.requests)
+    print(f"{args.members} members, {args.requests} requests each")
+    print(f"before (ORM + response_model + json): {before:6.1f} ms CPU/response, {before_bytes} bytes")
+    print(f"after  (Core select + orjson):        {after:6.1f} ms CPU/response, {after_bytes} bytes")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    run()
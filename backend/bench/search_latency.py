@@ -0,0 +1,152 @@
+"""
+Search index latency at scale: builds the in-memory user index for N users
+(default 1M) and times random 1-5 letter prefix queries through
+search_users / search_rooms, the calls the endpoints make (so under the index
+lock), both one at a time and from several threads at once while a writer
+keeps re-indexing users. Fails if admin user search p99 exceeds the budget in
+either run.
+
+    cd backend && python bench/search_latency.py [users] [--threads 4] [--rate 200] [--budget-ms 20]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from services import search  # noqa: E402
+from services.search import FIELD_NAME, SearchIndexes, _user_fields  # noqa: E402
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def timed_queries(run, queries):
+    latencies = []
+    truncated = 0
+    for query in queries:
+        started = time.perf_counter()
+        truncated += run(query)[2]
+        latencies.append(time.perf_counter() - started)
+    return latencies, truncated
+
+
+def concurrent_queries(run, queries, threads, rate, writes_per_second):
+    """
+    Spread queries over `threads` readers, issued at `rate` per second in total,
+    while one writer re-indexes users. Latency is measured from each query's
+    scheduled start, so time spent queued behind other threads counts.
+    """
+    results = [None] * threads
+    done = threading.Event()
+    interval = threads / rate
+
+    def reader(n):
+        latencies = []
+        truncated = 0
+        scheduled = time.perf_counter() + n / rate
+        for query in queries[n::threads]:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            truncated += run(query)[2]
+            latencies.append(time.perf_counter() - scheduled)
+            scheduled += interval
+        results[n] = latencies, truncated
+
+    def writer():
+        user_id = 0
+        while not done.wait(1 / writes_per_second):
+            search.index_user(SimpleNamespace(id=user_id, name=f"renamed {user_id}", email=f"renamed{user_id}@x.com"))
+            user_id += 1
+
+    write_thread = threading.Thread(target=writer)
+    write_thread.start()
+    readers = [threading.Thread(target=reader, args=(n,)) for n in range(threads)]
+    for thread in readers:
+        thread.start()
+    for thread in readers:
+        thread.join()
+    done.set()
+    write_thread.join()
+    return [latency for latencies, _ in results for latency in latencies], sum(t for _, t in results)
+
+
+def report(label, result):
+    latencies, truncated = result
+    p50, p99 = percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000
+    print(f"{label:36s} p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  "
+          f"({len(latencies)} queries, {truncated} truncated)")
+    return p99
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("users", type=int, nargs="?", default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=200, help="queries per second across all threads")
+    parser.add_argument("--writes-per-second", type=float, default=50)
+    parser.add_argument("--budget-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    random.seed(1)
+    words = ["".join(random.choices(string.ascii_lowercase, k=random.randint(3, 8))) for _ in range(50000)]
+
+    indexes = SearchIndexes()
+    started = time.perf_counter()
+    for user_id in range(args.users):
+        first, last = random.choice(words), random.choice(words)
+        indexes.users.add(user_id, _user_fields(f"{first} {last}", f"{first}.{last}{user_id}@nitc.ac.in"), keep_sorted=False)
+    indexes.users.finalize()
+    print(f"built user index for {args.users} users in {time.perf_counter() - started:.1f} s")
+
+    # Incremental writes, as the sync applies them
+    started = time.perf_counter()
+    for user_id in range(args.users, args.users + 1000):
+        indexes.users.add(user_id, _user_fields(f"{random.choice(words)} {random.choice(words)}", f"new{user_id}@x.com"))
+    print(f"incremental add: {(time.perf_counter() - started) * 1000 / 1000:.3f} ms/user")
+
+    for room_id in range(args.users // 10):
+        indexes.rooms.add(room_id, ((FIELD_NAME, f"{random.choice(words)} {random.choice(words)}"),), keep_sorted=False)
+    indexes.rooms.finalize()
+    indexes.ready = True
+    search._indexes = indexes
+
+    def users(query):
+        return search.search_users(query, 20, 0)
+
+    def rooms(query):
+        return search.search_rooms(query, 20, 0)
+
+    prefixes = [random.choice(words)[:random.randint(1, 5)] for _ in range(args.queries)]
+    p99 = report("admin user search", timed_queries(users, prefixes))
+    report("admin room search", timed_queries(rooms, prefixes))
+    member_rooms = [set(random.sample(range(args.users // 10), 50)) for _ in range(args.queries)]
+    report("member room search (50)", timed_queries(
+        lambda query_rooms: search.search_rooms(query_rooms[0], 20, 0, query_rooms[1]), list(zip(prefixes, member_rooms))
+    ))
+    concurrent_p99 = report(
+        f"admin user search ({args.threads} threads)",
+        concurrent_queries(users, prefixes, args.threads, args.rate, args.writes_per_second),
+    )
+
+    failed = [(label, value) for label, value in (("p99", p99), (f"{args.threads}-thread p99", concurrent_p99))
+              if value > args.budget_ms]
+    for label, value in failed:
+        print(f"FAIL: {label} {value:.2f} ms over the {args.budget_ms} ms budget")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
-engine=create_engine(SQLALCHEMY_DATABASE_URL)
+# Compiled-statement cache; sized above SQLAlchemy's default of 500 so the hot
+# statements in services/queries.py are never evicted by one-off queries
+SQLALCHEMY_QUERY_CACHE_SIZE = int(os.getenv("SQLALCHEMY_QUERY_CACHE_SIZE", "1200"))
+engine=create_engine(SQLALCHEMY_DATABASE_URL, query_cache_size=SQLALCHEMY_QUERY_CACHE_SIZE)
+
+if engine.dialect.name == "sqlite":
+    # SQLite ignores ON DELETE CASCADE unless foreign keys are switched on per connection
+    @event.listens_for(engine, "connect")
+    def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -20,4 +31,22 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def create_schema():
+    """
+    Create any missing tables, upgrade existing ones to the current models (see
+    schema_upgrade.py), then backfill derived tables for rows that predate them.
+    Run from the app lifespan or `python init_db.py`, never at import. Returns
+    the list of upgrades applied.
+    """
+    import models  # registers every model on Base.metadata
+    from schema_upgrade import upgrade_schema
+    from services import room_stats
+
+    Base.metadata.create_all(bind=engine)
+    changes = upgrade_schema(engine, Base.metadata)
+    with SessionLocal() as db:
+        room_stats.backfill_room_stats(db)
+        db.commit()
+    return changes
@@ -0,0 +1,7 @@
+"""Create or upgrade the database schema: python init_db.py"""
+from database import create_schema
+
+if __name__ == "__main__":
+    for change in create_schema():
+        print("Schema upgraded:", change)
+    print("Schema created")
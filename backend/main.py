@@ -1,22 +1,59 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from database import engine
+from database import create_schema
 from routers import login, auth,admin,room
-import models
-
+from tasks import room_purge, room_expiry, room_event_compaction
+from services import search, room_codes
+from security import revocation
+from services.admission import AdmissionControlMiddleware
+from services.profiler import RequestProfilingMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 # from admin import router as admin
 from fastapi.staticfiles import StaticFiles
 import os
 
-models.Base.metadata.create_all(bind=engine)
+# Set to 0 where the schema is managed out of band (e.g. `python init_db.py` in a release step)
+DB_AUTO_CREATE_SCHEMA = os.getenv("DB_AUTO_CREATE_SCHEMA", "1") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_AUTO_CREATE_SCHEMA:
+        for change in await asyncio.to_thread(create_schema):
+            print("Schema upgraded:", change)
+
+    background_tasks = [
+        asyncio.create_task(search.run_sync_scheduler()),
+        asyncio.create_task(revocation.run_sync_scheduler()),
+        asyncio.create_task(room_codes.run_sync_scheduler()),
+    ]
+    if room_purge.PURGE_ENABLED:
+        background_tasks.append(asyncio.create_task(room_purge.run_purge_worker()))
+    if room_expiry.EXPIRY_ENABLED:
+        background_tasks.append(asyncio.create_task(room_expiry.run_expiry_scheduler()))
+    if room_event_compaction.COMPACTION_ENABLED:
+        background_tasks.append(asyncio.create_task(room_event_compaction.run_compaction_scheduler()))
 
+    yield
 
-app = FastAPI()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins=[
     '*'
 ]
 
+# Innermost, so profiled request timings exclude time spent queued for admission
+app.add_middleware(RequestProfilingMiddleware)
+
+# Added before CORS so CORS stays the outer layer and shed 503s still carry CORS headers
+app.add_middleware(AdmissionControlMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
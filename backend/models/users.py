@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Text, DateTime, Table
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Boolean, Text, DateTime, Table, Index, JSON
 from sqlalchemy.orm import relationship
 from database import Base
 from sqlalchemy.sql.sqltypes import Float, Date
@@ -13,6 +13,10 @@ class User(Base):
     name = Column(String(255))
     profile_photo = Column(String(255), nullable=True)
     role = Column(String(255), index=True)
+    # Lets other workers' search indexes pick up new and changed users incrementally
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True, index=True)
+    # Tokens issued before this (epoch microseconds) are rejected; bumped on password change
+    tokens_valid_after = Column(BigInteger, nullable=True)
     
     # Relationship with Admin
     admin = relationship("Admin", back_populates="user", uselist=False)
@@ -34,24 +38,99 @@ class Room(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
-    code = Column(String(6), unique=True, index=True, nullable=False)  # Add this line
+    # Released (set to NULL) when the room expires so the code can be reused
+    code = Column(String(6), unique=True, index=True, nullable=True)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
     max_members = Column(Integer, default=10)
+    # Set when the room is deleted; the purge worker removes the rows later
+    deleted_at = Column(DateTime, nullable=True, index=True)
+    # Optional expiry; with idle_ttl_minutes set it is pushed forward on every join/leave/update
+    expires_at = Column(DateTime, nullable=True)
+    idle_ttl_minutes = Column(Integer, nullable=True)
     
     # Relationships
     creator = relationship("User", back_populates="created_rooms")
-    members = relationship("RoomMember", back_populates="room")
+    members = relationship("RoomMember", back_populates="room", passive_deletes=True)
+
+    __table_args__ = (
+        # Lets the expiry sweeper find due rooms without scanning inactive ones
+        Index("ix_rooms_active_expires", "is_active", "expires_at"),
+    )
 class RoomMember(Base):
     __tablename__ = "room_members"
 
     id = Column(Integer, primary_key=True, index=True)
-    room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    room_id = Column(Integer, ForeignKey("rooms.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     joined_at = Column(DateTime, default=datetime.utcnow)
     role = Column(String(50), default="member")  # member, admin, owner
     
     # Relationships
     room = relationship("Room", back_populates="members")
-    user = relationship("User", back_populates="room_memberships")
\ No newline at end of file
+    user = relationship("User", back_populates="room_memberships")
+
+    __table_args__ = (
+        # Serves the (room_id, user_id) membership probe and room_id-only lookups
+        Index("ix_room_members_room_user", "room_id", "user_id"),
+    )
+
+# Incrementally maintained aggregates, updated in the same transaction as
+# create/join/leave/delete so room stats never need a COUNT(*) scan.
+class RoomStats(Base):
+    __tablename__ = "room_stats"
+
+    room_id = Column(Integer, ForeignKey("rooms.id", ondelete="CASCADE"), primary_key=True)
+    member_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_room_stats_member_count", "member_count"),
+    )
+
+class RoomJoinDaily(Base):
+    __tablename__ = "room_join_daily"
+
+    room_id = Column(Integer, ForeignKey("rooms.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    joins = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_room_join_daily_day", "day"),
+    )
+
+
+# Lease rows used to make sure only one worker runs a given scheduled job at a time
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String(100), primary_key=True)
+    owner = Column(String(255), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+# Revoked refresh-token ids ("<jti>") and token families ("fam:<id>"). Families
+# are mirrored in memory by security/revocation.py so checks don't need a query.
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    reason = Column(String(20), nullable=False)  # rotated, logout, reuse
+    revoked_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# Append-only change log behind GET /api/rooms/changes; the id is the client's cursor.
+# No FK to rooms so delete events outlive the purge; compacted by age instead.
+class RoomEvent(Base):
+    __tablename__ = "room_events"
+
+    id = Column(Integer, primary_key=True)
+    room_id = Column(Integer, nullable=False, index=True)
+    type = Column(String(32), nullable=False)  # room_created, room_updated, room_deleted, member_joined, member_left, member_role_changed
+    # The member the event is about, so it stays visible to them after they leave
+    user_id = Column(Integer, nullable=True, index=True)
+    data = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response, UploadFile, File, Form, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Response, UploadFile, File, Form, Request, Query
+from fastapi.responses import PlainTextResponse
+import asyncio
+from sqlalchemy import select, insert, delete, exists
 from sqlalchemy.orm import Session
 
 from schemas.token import Token
+from schemas.admin import (
+    AdminStatsResponse, PurgeStatusResponse, AdminSearchResponse, AdmissionStatusResponse, RoomCodeStatusResponse, RequestProfilingStatusResponse,
+    AdminUserListResponse, UserIdsRequest, UserRoleChangeResponse
+)
 
-from models.users import User,Admin
+from models.users import User,Admin,Room
 
 from security.JWTtoken import create_access_token
 from database import get_db
@@ -12,16 +19,13 @@ from passlib.context import CryptContext
 
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
-from security.oauth2 import get_current_user
+from security.oauth2 import get_current_user, get_current_admin
+from services import room_stats, search, room_codes, profiler
+from services.admission import get_admission_status
+from tasks import room_purge
 
-import pandas as pd
 import random
 import string
-
-
-from fastapi.responses import StreamingResponse
-from PIL import Image, ImageDraw, ImageFont
-import io
 import os
 
 from typing import List
@@ -34,21 +38,252 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 get_db=get_db
 
-import os
-
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from pydantic import EmailStr, BaseModel
 
 
 from dotenv import load_dotenv
 load_dotenv()
-conf = ConnectionConfig(
-    MAIL_USERNAME='sip@nitc.ac.in',
-    MAIL_PASSWORD=os.getenv('MAIL_PASSWORD'),
-    MAIL_FROM='sip@nitc.ac.in',
-    MAIL_PORT=587,
-    MAIL_SERVER="smtp.gmail.com",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS= False,
-    USE_CREDENTIALS=True
-)
+
+@router.get("/stats", response_model=AdminStatsResponse)
+def get_admin_stats(
+    refresh: bool = False,
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Site-wide room and membership analytics (cached, see STATS_REFRESH_SECONDS)
+    """
+    return room_stats.get_summary(db, force_refresh=refresh)
+
+@router.get("/purge/status", response_model=PurgeStatusResponse)
+def get_purge_status(
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Soft-deleted room backlog and purge worker throughput
+    """
+    return room_purge.get_purge_status(db)
+
+@router.get("/search", response_model=AdminSearchResponse)
+def admin_search(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Prefix search over user names/emails and room names, best matches first
+    """
+    users_total, user_ids, users_truncated = search.search_users(q, limit, offset)
+    rooms_total, room_ids, rooms_truncated = search.search_rooms(q, limit, offset)
+
+    # Only the page is loaded from the database; keep the ranked order
+    users = {u.id: u for u in db.query(User).filter(User.id.in_(user_ids)).all()} if user_ids else {}
+    rooms = {r.id: r for r in db.query(Room).filter(
+        Room.id.in_(room_ids),
+        Room.deleted_at.is_(None)
+    ).all()} if room_ids else {}
+
+    return {
+        "query": q,
+        "limit": limit,
+        "offset": offset,
+        "users_total": users_total,
+        "users_truncated": users_truncated,
+        "users": [users[i] for i in user_ids if i in users],
+        "rooms_total": rooms_total,
+        "rooms_truncated": rooms_truncated,
+        "rooms": [rooms[i] for i in room_ids if i in rooms],
+    }
+
+@router.get("/users", response_model=AdminUserListResponse)
+def list_users(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    admins_only: bool = False,
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Users in id order with their admin status. Keyset paginated: pass the
+    previous page's next_after_id as after_id, so every page is an index range scan.
+    """
+    query = (
+        select(User.id, User.email, User.name, User.role, Admin.user_id)
+        .outerjoin(Admin, Admin.user_id == User.id)
+        .where(User.id > after_id)
+    )
+    if admins_only:
+        query = query.where(Admin.user_id.is_not(None))
+    rows = db.execute(query.order_by(User.id).limit(limit + 1)).all()
+    
+    users = [
+        {"id": user_id, "email": email, "name": name, "role": role, "is_admin": admin_id is not None}
+        for user_id, email, name, role, admin_id in rows[:limit]
+    ]
+    return {
+        "users": users,
+        "next_after_id": users[-1]["id"] if len(rows) > limit else None
+    }
+
+def _load_admin_flags(db: Session, user_ids):
+    """user id -> is_admin for the ids that exist, in one LEFT JOIN"""
+    rows = db.execute(
+        select(User.id, Admin.user_id)
+        .outerjoin(Admin, Admin.user_id == User.id)
+        .where(User.id.in_(user_ids))
+    ).all()
+    return {user_id: admin_id is not None for user_id, admin_id in rows}
+
+@router.post("/users/promote", response_model=UserRoleChangeResponse)
+def promote_users(
+    request: UserIdsRequest,
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Make many users admins with one INSERT ... SELECT
+    """
+    user_ids = list(dict.fromkeys(request.user_ids))
+    is_admin = _load_admin_flags(db, user_ids) if user_ids else {}
+    
+    to_promote = [user_id for user_id in user_ids if is_admin.get(user_id) is False]
+    changed = 0
+    if to_promote:
+        # NOT EXISTS guards against a concurrent promotion of the same user
+        changed = db.execute(insert(Admin).from_select(
+            ["user_id"],
+            select(User.id).where(
+                User.id.in_(to_promote),
+                ~exists().where(Admin.user_id == User.id)
+            )
+        )).rowcount
+        db.commit()
+    
+    results = []
+    for user_id in user_ids:
+        if user_id not in is_admin:
+            outcome = "not_found"
+        elif is_admin[user_id]:
+            outcome = "already_admin"
+        else:
+            outcome = "promoted"
+        results.append({"user_id": user_id, "status": outcome})
+    return {"changed": changed, "results": results}
+
+@router.post("/users/demote", response_model=UserRoleChangeResponse)
+def demote_users(
+    request: UserIdsRequest,
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Remove admin rights from many users with one DELETE. Admins can't demote
+    themselves here, so a batch can't leave the caller locked out.
+    """
+    user_ids = list(dict.fromkeys(request.user_ids))
+    is_admin = _load_admin_flags(db, user_ids) if user_ids else {}
+    
+    to_demote = [
+        user_id for user_id in user_ids
+        if is_admin.get(user_id) and user_id != current_admin.id
+    ]
+    changed = 0
+    if to_demote:
+        changed = db.execute(
+            delete(Admin).where(Admin.user_id.in_(to_demote)),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db.commit()
+    
+    results = []
+    for user_id in user_ids:
+        if user_id not in is_admin:
+            outcome = "not_found"
+        elif user_id == current_admin.id:
+            outcome = "forbidden"
+        elif not is_admin[user_id]:
+            outcome = "not_admin"
+        else:
+            outcome = "demoted"
+        results.append({"user_id": user_id, "status": outcome})
+    return {"changed": changed, "results": results}
+
+@router.get("/debug/admission", response_model=AdmissionStatusResponse)
+def admission_status(
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Live concurrency limits, in-flight requests and queue depth per route group
+    """
+    return get_admission_status()
+
+@router.get("/debug/room-codes", response_model=RoomCodeStatusResponse)
+def room_code_status(
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Size of the in-memory room code map and how join lookups were answered
+    """
+    return room_codes.get_status()
+
+@router.get("/debug/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    request: Request,
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(profiler.PROFILE_DEFAULT_INTERVAL_MS, ge=1, le=1000),
+    include_idle: bool = False,
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Sample this worker's stacks for `seconds` and return them as collapsed stacks
+    (flamegraph.pl / speedscope input), rooted at the FastAPI route template
+    """
+    result = await asyncio.to_thread(profiler.profile, request.app, seconds, interval_ms / 1000, include_idle)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profile is already running on this worker")
+    stacks, samples = result
+    return PlainTextResponse(stacks, headers={"X-Profile-Samples": str(samples)})
+
+@router.post("/debug/profile/requests", response_model=RequestProfilingStatusResponse)
+def enable_request_profiling(
+    request: Request,
+    route: str = Query(..., description="Route template, e.g. /api/rooms/rooms/{room_id}"),
+    method: str = "GET",
+    every: int = Query(100, ge=1),
+    keep: int = Query(10, ge=1, le=100),
+    interval_ms: float = Query(profiler.PROFILE_DEFAULT_INTERVAL_MS, ge=1, le=1000),
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Profile every `every`th request to one route on this worker, keeping the `keep` slowest.
+    Replaces any previous setting and its results.
+    """
+    target = profiler.find_route(request.app, method, route)
+    if target is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such route")
+    return profiler.enable_request_profiling(request.app, target, every, keep, interval_ms / 1000).snapshot()
+
+@router.get("/debug/profile/requests", response_model=RequestProfilingStatusResponse)
+def get_request_profiles(
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    The slowest profiled requests so far, each with its collapsed stacks
+    """
+    request_profiler = profiler.get_request_profiler()
+    if request_profiler is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Request profiling is not enabled")
+    return request_profiler.snapshot()
+
+@router.delete("/debug/profile/requests")
+def disable_request_profiling(
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Stop per-request profiling on this worker
+    """
+    profiler.disable_request_profiling()
+    return {"msg": "Request profiling disabled"}
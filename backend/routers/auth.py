@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 
 from schemas.token import Token, RefreshTokenRequest
 from models.users import User
-from security.JWTtoken import create_access_token, create_refresh_token
+from security.JWTtoken import create_token_pair
 from database import get_db
 
 from passlib.context import CryptContext
@@ -14,6 +14,8 @@ from security.oauth2 import get_current_user
 
 from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
 from security import JWTtoken
+from services import queries
+from security import revocation
 
 router =APIRouter(
     prefix="/api/auth",
@@ -24,11 +26,9 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 get_db=get_db
 
-@router.post("/refresh_token")
-def refresh_access_token(request:RefreshTokenRequest,db:Session=Depends(get_db)):
-    
+def _decode_refresh_token(refresh_token: str):
     try :
-        payload= JWTtoken.jwt.decode(request.refresh_token,JWTtoken.REFRESH_SECRET_KEY, algorithms=[JWTtoken.ALGORITHM])
+        payload= JWTtoken.jwt.decode(refresh_token,JWTtoken.REFRESH_SECRET_KEY, algorithms=[JWTtoken.ALGORITHM])
         email=payload.get("sub")
         if email is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
@@ -36,13 +36,42 @@ def refresh_access_token(request:RefreshTokenRequest,db:Session=Depends(get_db))
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token expired")
     except InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    return payload
+
+@router.post("/refresh_token")
+def refresh_access_token(request:RefreshTokenRequest,db:Session=Depends(get_db)):
+    """
+    Exchange a refresh token for a new access/refresh pair. Each refresh token
+    works once; presenting a used one again revokes its whole token family.
+    """
+    payload=_decode_refresh_token(request.refresh_token)
     
-    user=db.query(User).filter(User.email==email).first()
+    reuse_detected=HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token reuse detected")
+    
+    user=queries.get_user_by_email(db, payload["sub"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    access_token=create_access_token(data={"sub":user.email})
-    refresh_token=create_refresh_token(data={"sub":user.email})
+    if JWTtoken.issued_before_cutoff(payload, user.tokens_valid_after):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token revoked")
+    
+    # Tokens minted before rotation existed carry no jti/fam and can't be tracked;
+    # they are still accepted until they expire and are replaced by rotating ones
+    family=payload.get("fam")
+    if payload.get("jti") and family:
+        # In-memory check, no query
+        if revocation.is_family_revoked(payload):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token revoked")
+        
+        # A replayed token (or a concurrent refresh with the same one) loses the insert race
+        if not revocation.consume(db, payload, user.id):
+            revocation.revoke_family(db, payload, user.id, "reuse")
+            db.commit()
+            revocation.on_family_revoked(payload)
+            raise reuse_detected
+        db.commit()
+    
+    access_token,refresh_token=create_token_pair(data={"sub":user.email}, family=family)
 
 
     return Token(
@@ -53,4 +82,19 @@ def refresh_access_token(request:RefreshTokenRequest,db:Session=Depends(get_db))
         email=user.email,
         role=user.role
     )
-    
\ No newline at end of file
+
+@router.post("/logout")
+def logout(request:RefreshTokenRequest,db:Session=Depends(get_db)):
+    """
+    Revoke the session this refresh token belongs to, along with every access
+    token issued for it
+    """
+    payload=_decode_refresh_token(request.refresh_token)
+    
+    if payload.get("fam"):
+        user=queries.get_user_by_email(db, payload["sub"])
+        revocation.revoke_family(db, payload, user.id if user else None, "logout")
+        db.commit()
+        revocation.on_family_revoked(payload)
+    
+    return {"msg": "Logged out successfully"}
@@ -1,28 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response, Request, Form, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Request, Form, UploadFile, File, Header
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from fastapi.responses import RedirectResponse
 from schemas.token import Token
-from schemas.login import UserLogin, ForgotPasswordRequest, ChangePasswordRequest
+from schemas.login import UserLogin, ForgotPasswordRequest, ChangePasswordRequest, UserTypesRequest, UserTypesResponse
 from models.users import User, Admin
 # from models.rounds import Round
-from security.JWTtoken import create_access_token, create_refresh_token, verify_access_token
+from security.JWTtoken import create_access_token, create_token_pair, verify_access_token, issued_before_cutoff, epoch_micros
 from database import get_db
 
 from passlib.context import CryptContext
 
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
-from security.oauth2 import get_current_user
+from security.oauth2 import get_current_user, get_current_admin
+from security import rate_limit
+from services import search, queries
+from services.idempotency import run_idempotent_async
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from pydantic import EmailStr, BaseModel
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
 import shutil
+from typing import Optional
 
 from urllib.parse import urlencode
 
@@ -47,16 +50,21 @@ GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 PROFILE_PHOTOS_DIR = "profile_photos"
 os.makedirs(PROFILE_PHOTOS_DIR, exist_ok=True)
 
-conf = ConnectionConfig(
-    MAIL_USERNAME='pratheek18183@gmail.com',
-    MAIL_PASSWORD=os.getenv('MAIL_PASSWORD'),
-    MAIL_FROM='pratheek18183@gmail.com',
-    MAIL_PORT=587,
-    MAIL_SERVER="smtp.gmail.com",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True
-)
+# fastapi_mail and google-auth are imported on first use of the endpoints that
+# need them, keeping them out of worker start-up
+@lru_cache(maxsize=None)
+def get_mail_conf():
+    from fastapi_mail import ConnectionConfig
+    return ConnectionConfig(
+        MAIL_USERNAME='pratheek18183@gmail.com',
+        MAIL_PASSWORD=os.getenv('MAIL_PASSWORD'),
+        MAIL_FROM='pratheek18183@gmail.com',
+        MAIL_PORT=587,
+        MAIL_SERVER="smtp.gmail.com",
+        MAIL_STARTTLS=True,
+        MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=True
+    )
 
 @router.post("/auth/google/login")
 async def google_login(request: Request, db: Session = Depends(get_db)):
@@ -65,6 +73,9 @@ async def google_login(request: Request, db: Session = Depends(get_db)):
     if not token:
         raise HTTPException(status_code=400, detail="No token provided")
 
+    from google.oauth2 import id_token
+    from google.auth.transport import requests as google_requests
+
     try:
         idinfo = id_token.verify_oauth2_token(token, google_requests.Request(), GOOGLE_CLIENT_ID)
         email = idinfo["email"]
@@ -74,7 +85,7 @@ async def google_login(request: Request, db: Session = Depends(get_db)):
     
     # Commented out round check since Round model is not available
     # round = db.query(Round).filter(Round.id == 1).first()
-    user = db.query(User).filter(User.email == email).first()
+    user = queries.get_user_by_email(db, email)
     
     # Commented out round-related logic
     # if user and user.role == "Verified Email" and (round.number == 3 and round.allow_reg == 0):
@@ -94,10 +105,10 @@ async def google_login(request: Request, db: Session = Depends(get_db)):
         db.add(user)
         db.commit()
         db.refresh(user)
+        search.index_user(user)
         # No need to create normal_user entry anymore
 
-    access_token = create_access_token(data={"sub": user.email})
-    refresh_token = create_refresh_token(data={"sub": user.email})
+    access_token, refresh_token = create_token_pair(data={"sub": user.email})
 
     return {
         "access_token": access_token,
@@ -107,15 +118,15 @@ async def google_login(request: Request, db: Session = Depends(get_db)):
     }
 
 @router.post('/login')  
-def login(request: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == request.email).first()
+def login(request: UserLogin, http_request: Request, db: Session = Depends(get_db)):
+    rate_limit.check("login", ip=rate_limit.client_ip(http_request), email=request.email.lower())
+    user = queries.get_user_by_email(db, request.email)
     if not user:
         raise HTTPException(status_code=401, detail="User not Found")
     if not pwd_context.verify(request.password, user.password):
         raise HTTPException(status_code=401, detail="Invalid Credentials")
     
-    access_token = create_access_token(data={"sub": user.email})
-    refresh_token = create_refresh_token(data={"sub": user.email})
+    access_token, refresh_token = create_token_pair(data={"sub": user.email})
     
     print(access_token)
     return Token(
@@ -128,8 +139,9 @@ def login(request: UserLogin, db: Session = Depends(get_db)):
     )
 
 @router.post('/forgot_password') 
-async def forgot_password(request: ForgotPasswordRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == request.email).first()
+async def forgot_password(request: ForgotPasswordRequest, http_request: Request, db: Session = Depends(get_db)):
+    rate_limit.check("forgot_password", ip=rate_limit.client_ip(http_request), email=request.email.lower())
+    user = queries.get_user_by_email(db, request.email)
     if not user:
         return {"msg": "If this email exists, a reset link will be sent."}
     
@@ -140,6 +152,8 @@ async def forgot_password(request: ForgotPasswordRequest, db: Session = Depends(
     frontend_url = os.getenv('FRONTEND_URL')
     reset_link = f"{frontend_url}/reset_password?token={reset_token}"
 
+    from fastapi_mail import FastMail, MessageSchema
+
     message = MessageSchema(
         subject="Change password on NITC SIP Portal",
         recipients=[request.email],
@@ -151,7 +165,7 @@ async def forgot_password(request: ForgotPasswordRequest, db: Session = Depends(
         """,
         subtype="html"
     )
-    fm = FastMail(conf)
+    fm = FastMail(get_mail_conf())
 
     await fm.send_message(message)
     return {"msg": f"Password Reset email sent to {request.email}"}
@@ -167,11 +181,17 @@ async def change_password(request: ChangePasswordRequest, db: Session = Depends(
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     
-    user = db.query(User).filter(User.email == email).first()
+    user = queries.get_user_by_email(db, email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    # Reset links are single-use: the cutoff below invalidates this one too
+    if issued_before_cutoff(payload, user.tokens_valid_after):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    
     user.password = pwd_context.hash(request.password)
+    # Revoke every access and refresh token issued so far
+    user.tokens_valid_after = epoch_micros(datetime.now(timezone.utc))
     db.commit() 
     db.refresh(user)    
     return {"msg": "Password changed successfully"}
@@ -183,10 +203,25 @@ async def register(
     password: str = Form(...),
     name: str = Form(...),
     profile_photo: UploadFile = File(None),  # Make it optional
+    response: Response = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db)
 ):
+    # Retries with the same Idempotency-Key replay the first result instead of
+    # hashing the password again and failing with "already exists". The password
+    # stays out of the fingerprint so nothing derived from it is kept in memory.
+    fingerprint = f"{email.lower()}\0{name}"
+    return await run_idempotent_async(
+        ("register", email.lower()),
+        idempotency_key,
+        fingerprint,
+        lambda: _register(email, password, name, profile_photo, db),
+        response
+    )
+
+async def _register(email: str, password: str, name: str, profile_photo: Optional[UploadFile], db: Session):
     # Check if user exists
-    user = db.query(User).filter(User.email == email).first()
+    user = queries.get_user_by_email(db, email)
     if user:
         raise HTTPException(status_code=400, detail="User with this email already exists")
     
@@ -221,6 +256,7 @@ async def register(
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    search.index_user(new_user)
     
     # No need to create normal_user entry anymore
     
@@ -247,6 +283,34 @@ def get_user_type(user_id: int, db: Session = Depends(get_db)):
     # If not admin, it's a regular user
     return {"user_type": "user", "user_id": user_id}
 
+@router.post('/user/types', response_model=UserTypesResponse)
+def get_user_types(
+    request: UserTypesRequest,
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    """
+    Batch form of /user/{user_id}/type: every id resolved in one LEFT JOIN to admins
+    """
+    user_ids = list(dict.fromkeys(request.user_ids))
+    if not user_ids:
+        return {"users": [], "not_found": []}
+    
+    rows = db.execute(
+        select(User.id, Admin.user_id)
+        .outerjoin(Admin, Admin.user_id == User.id)
+        .where(User.id.in_(user_ids))
+    ).all()
+    user_types = {user_id: "admin" if admin_id is not None else "user" for user_id, admin_id in rows}
+    
+    return {
+        "users": [
+            {"user_id": user_id, "user_type": user_types[user_id]}
+            for user_id in user_ids if user_id in user_types
+        ],
+        "not_found": [user_id for user_id in user_ids if user_id not in user_types]
+    }
+
 # Endpoint to promote a user to admin
 @router.post('/user/{user_id}/promote-to-admin')
 def promote_to_admin(user_id: int, db: Session = Depends(get_db)):
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response, Request
+from typing import Optional
 from sqlalchemy.orm import Session
 from typing import List
 import secrets
 import string
 from database import get_db
 from models.users import User, Room, RoomMember
-from schemas.room import RoomCreate, RoomResponse, RoomUpdate, RoomWithMembersResponse
+from schemas.room import RoomCreate, RoomResponse, RoomUpdate, RoomWithMembersResponse, RoomStatsResponse, RoomSearchResponse, RoomChangesResponse, RoomMemberBatchRequest, RoomMemberBatchResponse
+from services import room_stats, search, room_views, queries, room_events, room_members, room_codes
+from services.fast_json import FastJSONResponse, json_response
+from services.idempotency import run_idempotent
 from security.oauth2 import get_current_user
-from datetime import datetime
+from security import rate_limit
+from datetime import datetime, timedelta
 
 router = APIRouter(
     prefix="/api/rooms",
@@ -19,21 +24,57 @@ def generate_room_code(length=6):
     characters = string.ascii_uppercase + string.digits
     return ''.join(secrets.choice(characters) for _ in range(length))
 
+def generate_unique_room_code(db: Session):
+    """Generate a room code that is not currently held by any room"""
+    while True:
+        room_code = generate_room_code()
+        existing_room = db.query(Room).filter(Room.code == room_code).first()
+        if not existing_room:
+            return room_code
+
+def touch_room_expiry(room: Room):
+    """Push an idle-TTL room's expiry forward after activity"""
+    if room.idle_ttl_minutes:
+        room.expires_at = datetime.utcnow() + timedelta(minutes=room.idle_ttl_minutes)
+
+def is_room_expired(room: Room):
+    return room.expires_at is not None and room.expires_at <= datetime.utcnow()
+
+def room_fields(
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated fields to return, e.g. name,members.user_name,members.role"
+    )
+):
+    """Parsed `fields=` projection for the room read endpoints"""
+    try:
+        return room_views.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 @router.post("/create_room", response_model=RoomResponse)
 def create_room(
     room_data: RoomCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Create a new room with a random 6-digit code
+    Create a new room with a random 6-digit code.
+    Retries carrying the same Idempotency-Key get the originally created room back.
     """
+    return run_idempotent(
+        ("create_room", current_user.id),
+        idempotency_key,
+        room_data.model_dump_json(),
+        lambda: _create_room(room_data, db, current_user),
+        response
+    )
+
+def _create_room(room_data: RoomCreate, db: Session, current_user: User):
     # Generate unique room code
-    while True:
-        room_code = generate_room_code()
-        existing_room = db.query(Room).filter(Room.code == room_code).first()
-        if not existing_room:
-            break
+    room_code = generate_unique_room_code(db)
     
     # Create new room
     new_room = Room(
@@ -41,8 +82,11 @@ def create_room(
         description=room_data.description,
         max_members=room_data.max_members,
         created_by=current_user.id,
-        code=room_code
+        code=room_code,
+        expires_at=room_data.expires_at,
+        idle_ttl_minutes=room_data.idle_ttl_minutes
     )
+    touch_room_expiry(new_room)
     
     db.add(new_room)
     db.commit()
@@ -55,17 +99,26 @@ def create_room(
         role="owner"
     )
     db.add(creator_member)
+    room_stats.on_room_created(db, new_room.id)
+    room_stats.on_members_joined(db, new_room.id)
+    room_events.on_room_created(db, new_room)
     db.commit()
+    search.index_room(new_room)
+    room_codes.on_room_changed(new_room)
     
-    return new_room
+    # Serialized here so a replay doesn't touch a detached ORM object
+    return RoomResponse.model_validate(new_room)
 
 @router.get("/rooms", response_model=List[RoomWithMembersResponse])
 def get_my_rooms(
+    request: Request,
+    fields: tuple = Depends(room_fields),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get all rooms where current user is a member
+    Get all rooms where current user is a member.
+    `fields=` trims the payload; large responses are streamed and compressed.
     """
     # Get room IDs where user is a member
     user_room_ids = db.query(RoomMember.room_id).filter(
@@ -73,41 +126,27 @@ def get_my_rooms(
     ).all()
     user_room_ids = [room_id for (room_id,) in user_room_ids]
     
-    # Get rooms with their members
-    rooms = db.query(Room).filter(Room.id.in_(user_room_ids)).all()
-    
-    room_responses = []
-    for room in rooms:
-        # Get room members with user details
-        members = db.query(RoomMember, User).join(
-            User, RoomMember.user_id == User.id
-        ).filter(RoomMember.room_id == room.id).all()
-        
-        member_responses = []
-        for member, user in members:
-            member_responses.append({
-                "id": member.id,
-                "user_id": user.id,
-                "user_name": user.name,
-                "user_email": user.email,
-                "role": member.role,
-                "joined_at": member.joined_at
-            })
-        
-        # Get creator name
-        creator = db.query(User).filter(User.id == room.created_by).first()
-        
-        room_responses.append({
-            **room.__dict__,
-            "members": member_responses,
-            "creator_name": creator.name if creator else "Unknown"
-        })
-    
-    return room_responses
+    # Rooms and their members in at most two column-only queries, rendered without re-validation
+    return json_response(request, room_views.load_rooms_with_members(db, user_room_ids, fields))
+
+@router.get("/changes", response_model=RoomChangesResponse)
+def get_room_changes(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(room_events.ROOM_EVENTS_PAGE_SIZE, ge=1, le=room_events.ROOM_EVENTS_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Changes to the current user's rooms since `since` (the cursor from the previous call).
+    On `reset`, refetch /rooms and carry on polling from the returned cursor.
+    """
+    return FastJSONResponse(room_events.get_changes(db, current_user.id, since, limit))
 
 @router.get("/rooms/{room_id}", response_model=RoomWithMembersResponse)
 def get_room_details(
     room_id: int,
+    request: Request,
+    fields: tuple = Depends(room_fields),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -115,10 +154,7 @@ def get_room_details(
     Get specific room details
     """
     # Check if user is member of this room
-    membership = db.query(RoomMember).filter(
-        RoomMember.room_id == room_id,
-        RoomMember.user_id == current_user.id
-    ).first()
+    membership = queries.get_membership(db, room_id, current_user.id)
     
     if not membership:
         raise HTTPException(
@@ -126,37 +162,14 @@ def get_room_details(
             detail="You are not a member of this room"
         )
     
-    room = db.query(Room).filter(Room.id == room_id).first()
-    if not room:
+    rooms = room_views.load_rooms_with_members(db, [room_id], fields)
+    if not rooms:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Room not found"
         )
     
-    # Get room members with user details
-    members = db.query(RoomMember, User).join(
-        User, RoomMember.user_id == User.id
-    ).filter(RoomMember.room_id == room_id).all()
-    
-    member_responses = []
-    for member, user in members:
-        member_responses.append({
-            "id": member.id,
-            "user_id": user.id,
-            "user_name": user.name,
-            "user_email": user.email,
-            "role": member.role,
-            "joined_at": member.joined_at
-        })
-    
-    # Get creator name
-    creator = db.query(User).filter(User.id == room.created_by).first()
-    
-    return {
-        **room.__dict__,
-        "members": member_responses,
-        "creator_name": creator.name if creator else "Unknown"
-    }
+    return json_response(request, rooms[0])
 
 @router.put("/rooms/{room_id}", response_model=RoomResponse)
 def update_room(
@@ -169,11 +182,7 @@ def update_room(
     Update room details (only room owner/admin can update)
     """
     # Check if user has permission to update (owner or admin role in room)
-    membership = db.query(RoomMember).filter(
-        RoomMember.room_id == room_id,
-        RoomMember.user_id == current_user.id,
-        RoomMember.role.in_(["owner", "admin"])
-    ).first()
+    membership = queries.get_membership(db, room_id, current_user.id, roles=("owner", "admin"))
     
     if not membership:
         raise HTTPException(
@@ -181,7 +190,7 @@ def update_room(
             detail="You don't have permission to update this room"
         )
     
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = queries.get_room(db, room_id)
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -193,38 +202,91 @@ def update_room(
     for field, value in update_data.items():
         setattr(room, field, value)
     
+    changes = dict(update_data)
+    if "expires_at" not in update_data and room.idle_ttl_minutes:
+        touch_room_expiry(room)
+        changes["expires_at"] = room.expires_at
+    
+    # An expired room gave its code up; reactivating it needs a fresh one
+    if room.is_active and room.code is None:
+        if is_room_expired(room):
+            if "expires_at" in update_data:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="expires_at must be in the future to reactivate the room"
+                )
+            # Left over from the expiry; the sweep would deactivate the room again straight away
+            room.expires_at = None
+            changes["expires_at"] = None
+        room.code = generate_unique_room_code(db)
+        changes["code"] = room.code
+    
+    room_events.on_room_updated(db, room.id, changes)
     db.commit()
     db.refresh(room)
+    search.index_room(room)
+    room_codes.on_room_changed(room)
     
     return room
 
-@router.post("/join/{room_code}")
+@router.post("/join/{room_code}", dependencies=[Depends(rate_limit.limit_by_ip_and_user("join_room"))])
 def join_room_by_code(
     room_code: str,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Join a room using 6-digit room code
+    Join a room using 6-digit room code.
+    Retries carrying the same Idempotency-Key get the original result instead of "already a member".
     """
-    room = db.query(Room).filter(Room.code == room_code.upper()).first()
+    return run_idempotent(
+        ("join_room", current_user.id),
+        idempotency_key,
+        room_code.upper(),
+        lambda: _join_room_by_code(room_code, db, current_user),
+        response
+    )
+
+def _join_room_by_code(room_code: str, db: Session, current_user: User):
+    code = room_code.upper()
+    not_found = HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Room not found with this code"
+    )
+    not_active = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Room is not active"
+    )
+    
+    # Recently confirmed unknown codes and inactive codes are answered from the in-memory code map without a query
+    entry = room_codes.lookup(code)
+    if entry is None:
+        raise not_found
+    if entry is room_codes.UNKNOWN:
+        room = queries.get_room_by_code(db, code)
+        room_codes.record_lookup(code, room)
+    else:
+        if not entry.is_active:
+            raise not_active
+        room = queries.get_room(db, entry.room_id)
+        if room is None or room.code != code:
+            # Map was stale (e.g. the code moved to another room on another worker)
+            room = queries.get_room_by_code(db, code)
+            room_codes.record_miss(room, code)
+    
     if not room:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Room not found with this code"
-        )
+        raise not_found
     
-    if not room.is_active:
+    if not room.is_active or is_room_expired(room):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Room is not active"
         )
     
     # Check if user is already a member
-    existing_member = db.query(RoomMember).filter(
-        RoomMember.room_id == room.id,
-        RoomMember.user_id == current_user.id
-    ).first()
+    existing_member = queries.get_membership(db, room.id, current_user.id)
     
     if existing_member:
         raise HTTPException(
@@ -233,9 +295,7 @@ def join_room_by_code(
         )
     
     # Check if room has reached maximum members
-    current_member_count = db.query(RoomMember).filter(
-        RoomMember.room_id == room.id
-    ).count()
+    current_member_count = queries.count_room_members(db, room.id)
     
     if current_member_count >= room.max_members:
         raise HTTPException(
@@ -251,6 +311,11 @@ def join_room_by_code(
     )
     
     db.add(new_member)
+    # Assigns the member id and joined_at for the change event
+    db.flush()
+    room_stats.on_members_joined(db, room.id)
+    touch_room_expiry(room)
+    room_events.on_member_joined(db, room, new_member, current_user)
     db.commit()
     
     return {
@@ -268,10 +333,7 @@ def leave_room(
     """
     Leave a room (for room members)
     """
-    membership = db.query(RoomMember).filter(
-        RoomMember.room_id == room_id,
-        RoomMember.user_id == current_user.id
-    ).first()
+    membership = queries.get_membership(db, room_id, current_user.id)
     
     if not membership:
         raise HTTPException(
@@ -279,6 +341,15 @@ def leave_room(
             detail="You are not a member of this room"
         )
     
+    room = queries.get_room(db, room_id)
+    if not room:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Room not found"
+        )
+    
+    room_deleted = False
+    
     # If user is the owner, handle ownership transfer or delete room
     if membership.role == "owner":
         # Check if there are other members who could be made owner
@@ -291,13 +362,24 @@ def leave_room(
             # Transfer ownership to the first admin or member
             new_owner = next((m for m in other_members if m.role == "admin"), other_members[0])
             new_owner.role = "owner"
+            room_events.on_member_role_changed(db, room_id, new_owner)
         else:
-            # No other members, delete the room
-            room = db.query(Room).filter(Room.id == room_id).first()
-            db.delete(room)
+            # No other members, soft-delete the room; the purge worker removes it
+            room.deleted_at = datetime.utcnow()
+            room.is_active = False
+            room_deleted = True
     
     db.delete(membership)
+    if room_deleted:
+        room_events.on_room_deleted(db, room_id)
+    else:
+        room_stats.on_members_left(db, room_id)
+        touch_room_expiry(room)
+    room_events.on_member_left(db, room, membership)
     db.commit()
+    if room_deleted:
+        search.unindex_room(room_id)
+        room_codes.on_room_deleted(room_id)
     
     return {"message": "Successfully left the room"}
 
@@ -311,11 +393,7 @@ def delete_room(
     Delete a room (only room owner can delete)
     """
     # Check if user is the owner of the room
-    membership = db.query(RoomMember).filter(
-        RoomMember.room_id == room_id,
-        RoomMember.user_id == current_user.id,
-        RoomMember.role == "owner"
-    ).first()
+    membership = queries.get_membership(db, room_id, current_user.id, roles=("owner",))
     
     if not membership:
         raise HTTPException(
@@ -323,18 +401,124 @@ def delete_room(
             detail="Only room owner can delete the room"
         )
     
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = queries.get_room(db, room_id)
+    if not room:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Room not found"
+        )
+    
+    # Hide the room immediately; members are removed in batches by the
+    # purge worker (tasks/room_purge.py) instead of inside this request
+    room.deleted_at = datetime.utcnow()
+    room.is_active = False
+    room_events.on_room_deleted(db, room_id)
+    db.commit()
+    search.unindex_room(room_id)
+    room_codes.on_room_deleted(room_id)
+    
+    return {"message": "Room deleted successfully"}
+
+@router.post("/rooms/{room_id}/members:batch", response_model=RoomMemberBatchResponse)
+def batch_update_members(
+    room_id: int,
+    batch: RoomMemberBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Add, remove or change the role of many members at once (room owner/admin only).
+    Each item reports its own outcome; admins can only manage plain members.
+    """
+    membership = queries.get_membership(db, room_id, current_user.id, roles=("owner", "admin"))
+    
+    if not membership:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to manage members of this room"
+        )
+    
+    room = queries.get_room(db, room_id)
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Room not found"
         )
     
-    # Delete all room members first (due to foreign key constraints)
-    db.query(RoomMember).filter(RoomMember.room_id == room_id).delete()
+    if batch.add and (not room.is_active or is_room_expired(room)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Room is not active"
+        )
+    
+    if batch.add or batch.remove:
+        touch_room_expiry(room)
+    
+    results, member_count = room_members.apply_member_batch(db, room, membership, batch)
+    db.commit()
+    
+    return {
+        "room_id": room_id,
+        "member_count": member_count,
+        "results": results
+    }
+
+@router.get("/rooms/{room_id}/stats", response_model=RoomStatsResponse)
+def get_room_stats(
+    room_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get occupancy and join history for a room (served from aggregate tables)
+    """
+    membership = queries.get_membership(db, room_id, current_user.id)
+    
+    if not membership:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not a member of this room"
+        )
+    
+    room = queries.get_room(db, room_id)
+    if not room:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Room not found"
+        )
     
-    # Delete the room
-    db.delete(room)
+    stats = room_stats.get_room_stats(db, room)
     db.commit()
     
-    return {"message": "Room deleted successfully"}
\ No newline at end of file
+    return stats
+
+@router.get("/search", response_model=RoomSearchResponse)
+def search_my_rooms(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Prefix search over the names of rooms the current user belongs to
+    """
+    user_room_ids = {room_id for (room_id,) in db.query(RoomMember.room_id).filter(
+        RoomMember.user_id == current_user.id
+    ).all()}
+    
+    # Scoped to the user's rooms, so never truncated
+    total, room_ids, _ = search.search_rooms(q, limit, offset, allowed_ids=user_room_ids)
+    
+    rooms = {r.id: r for r in db.query(Room).filter(
+        Room.id.in_(room_ids),
+        Room.deleted_at.is_(None)
+    ).all()} if room_ids else {}
+    
+    return {
+        "query": q,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "results": [rooms[i] for i in room_ids if i in rooms]
+    }
@@ -0,0 +1,130 @@
+"""
+Brings tables that already exist up to date with the models. create_all() only
+creates missing tables, so on a database made by an older release this adds
+missing columns and indexes, drops NOT NULL where a model column became
+nullable, and recreates foreign keys whose ON DELETE rule changed. SQLite can't
+alter nullability or foreign keys in place, so there the table is rebuilt.
+Called from database.create_schema(); only ever relaxes or adds, never drops data.
+"""
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import AddConstraint, CreateColumn, CreateTable, MetaData, Table
+
+
+def _ondelete(rule):
+    rule = (rule or "NO ACTION").upper()
+    return "NO ACTION" if rule == "RESTRICT" else rule
+
+
+def _plan(inspector, table: Table):
+    """(missing columns, columns to make nullable, (foreign key, existing name or None), missing indexes)"""
+    db_columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+    missing = [column for column in table.columns if column.name not in db_columns]
+    relax = [
+        column for column in table.columns
+        if column.name in db_columns and column.nullable and not column.primary_key
+        and not db_columns[column.name]["nullable"]
+    ]
+
+    db_foreign_keys = {
+        tuple(fk["constrained_columns"]): fk for fk in inspector.get_foreign_keys(table.name)
+    }
+    foreign_keys = []
+    for fk in table.foreign_key_constraints:
+        current = db_foreign_keys.get(tuple(fk.column_keys))
+        if current is None or _ondelete(current.get("options", {}).get("ondelete")) != _ondelete(fk.ondelete):
+            foreign_keys.append((fk, current["name"] if current else None))
+
+    db_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    indexes = [index for index in table.indexes if index.name not in db_indexes]
+    return missing, relax, foreign_keys, indexes
+
+
+def _alter_in_place(conn, table: Table, missing, relax, foreign_keys, indexes):
+    dialect = conn.dialect
+    preparer = dialect.identifier_preparer
+    table_name = preparer.format_table(table)
+    changes = []
+
+    for column in missing:
+        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {CreateColumn(column).compile(dialect=dialect)}")
+        changes.append(f"{table.name}.{column.name}: added")
+
+    for column in relax:
+        column_name = preparer.format_column(column)
+        if dialect.name == "mysql":
+            # MODIFY restates the whole column definition
+            conn.exec_driver_sql(
+                f"ALTER TABLE {table_name} MODIFY {column_name} {column.type.compile(dialect=dialect)} NULL"
+            )
+        else:
+            conn.exec_driver_sql(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} DROP NOT NULL")
+        changes.append(f"{table.name}.{column.name}: now nullable")
+
+    for fk, existing_name in foreign_keys:
+        if existing_name:
+            drop = "DROP FOREIGN KEY" if dialect.name == "mysql" else "DROP CONSTRAINT"
+            conn.exec_driver_sql(f"ALTER TABLE {table_name} {drop} {preparer.quote(existing_name)}")
+        conn.execute(AddConstraint(fk))
+        changes.append(f"{table.name}({', '.join(fk.column_keys)}): foreign key ON DELETE {_ondelete(fk.ondelete)}")
+
+    for index in indexes:
+        index.create(conn)
+        changes.append(f"{table.name}: index {index.name} created")
+    return changes
+
+
+def _rebuild_sqlite_table(engine: Engine, table: Table, inspector):
+    """
+    SQLite's documented procedure for changes ALTER TABLE can't make: create the
+    new shape under a temporary name, copy the rows, drop the old table and
+    rename, with foreign key enforcement off for the duration.
+    """
+    db_columns = {column["name"] for column in inspector.get_columns(table.name)}
+    preparer = engine.dialect.identifier_preparer
+    columns = ", ".join(preparer.format_column(column) for column in table.columns if column.name in db_columns)
+    table_name = preparer.format_table(table)
+
+    # Copied into the same metadata so its foreign keys resolve; removed again below
+    temp = table.to_metadata(table.metadata, name=f"_upgrade_{table.name}")
+    temp_name = preparer.quote(temp.name)
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        conn.commit()
+        try:
+            with conn.begin():
+                conn.execute(CreateTable(temp))
+                conn.exec_driver_sql(f"INSERT INTO {temp_name} ({columns}) SELECT {columns} FROM {table_name}")
+                conn.exec_driver_sql(f"DROP TABLE {table_name}")
+                conn.exec_driver_sql(f"ALTER TABLE {temp_name} RENAME TO {table_name}")
+                for index in table.indexes:
+                    index.create(conn)
+                violations = conn.exec_driver_sql(f"PRAGMA foreign_key_check({table_name})").all()
+                if violations:
+                    raise RuntimeError(f"{table.name}: {len(violations)} rows violate foreign keys after rebuild")
+        finally:
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+            conn.commit()
+            table.metadata.remove(temp)
+    return [f"{table.name}: rebuilt"]
+
+
+def upgrade_schema(engine: Engine, metadata: MetaData):
+    """Apply every pending change to existing tables; returns one line per change made"""
+    changes = []
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    for table in metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        missing, relax, foreign_keys, indexes = _plan(inspector, table)
+        if not (missing or relax or foreign_keys or indexes):
+            continue
+        if engine.dialect.name == "sqlite" and (relax or foreign_keys):
+            changes += _rebuild_sqlite_table(engine, table, inspector)
+        else:
+            with engine.begin() as conn:
+                changes += _alter_in_place(conn, table, missing, relax, foreign_keys, indexes)
+        inspector = inspect(engine)
+    return changes
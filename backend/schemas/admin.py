@@ -1,6 +1,137 @@
-from pydantic import BaseModel, EmailStr
-from datetime import date
+from pydantic import BaseModel, EmailStr, Field
+from datetime import date, datetime
+from typing import List, Optional
 
+from schemas.room import RoomJoinsPerDay, RoomSearchResult
+from schemas.login import MAX_USER_BATCH
 
 
+class TopRoomResponse(BaseModel):
+    room_id: int
+    room_name: str
+    total_members: int
+    max_members: int
+    occupancy: float
+    is_active: bool
 
+class AdminStatsResponse(BaseModel):
+    total_rooms: int
+    active_rooms: int
+    inactive_rooms: int
+    total_members: int
+    average_members_per_room: float
+    top_rooms: List[TopRoomResponse] = []
+    joins_per_day: List[RoomJoinsPerDay] = []
+    generated_at: datetime
+
+class PurgeStatusResponse(BaseModel):
+    enabled: bool
+    interval_seconds: float
+    batch_size: int
+    backlog_rooms: int
+    backlog_members: int
+    runs: int
+    rooms_purged: int
+    members_purged: int
+    batches: int
+    errors: int
+    last_run_at: Optional[datetime] = None
+    last_run_seconds: float
+    last_run_members_per_second: float
+    last_error: Optional[str] = None
+
+class UserSearchResult(BaseModel):
+    id: int
+    name: Optional[str] = None
+    email: str
+    role: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class AdminSearchResponse(BaseModel):
+    query: str
+    limit: int
+    offset: int
+    users_total: int
+    # Set when a very short query matched more postings than are scanned; the total is then a lower bound
+    users_truncated: bool = False
+    users: List[UserSearchResult] = []
+    rooms_total: int
+    rooms_truncated: bool = False
+    rooms: List[RoomSearchResult] = []
+
+class AdmissionGroupStatus(BaseModel):
+    name: str
+    limit: int
+    max_queue: int
+    queue_timeout: float
+    active: int
+    waiting: int
+    admitted: int
+    shed_queue_full: int
+    shed_timeout: int
+
+class AdmissionStatusResponse(BaseModel):
+    groups: List[AdmissionGroupStatus] = []
+
+class RoomCodeStatusResponse(BaseModel):
+    ready: bool
+    codes: int
+    lookups: int
+    hits: int
+    inactive_hits: int
+    negative_hits: int
+    unmapped: int
+    late_codes: int
+    misses: int
+    bypassed: int
+    hit_rate: float
+    negative_hit_rate: float
+    late_code_rate: float
+    answered_from_memory_rate: float
+    miss_rate: float
+    loads: int
+    last_load_at: Optional[datetime] = None
+    last_sync_at: Optional[datetime] = None
+
+class ProfiledRequest(BaseModel):
+    route: str
+    path: str
+    started_at: datetime
+    duration_ms: float
+    samples: int
+    collapsed: str
+
+class RequestProfilingStatusResponse(BaseModel):
+    route: str
+    every: int
+    keep: int
+    interval_ms: float
+    requests_seen: int
+    requests_profiled: int
+    slowest: List[ProfiledRequest] = []
+
+class AdminUserListItem(BaseModel):
+    id: int
+    email: Optional[str] = None
+    name: Optional[str] = None
+    role: Optional[str] = None
+    is_admin: bool
+
+class AdminUserListResponse(BaseModel):
+    users: List[AdminUserListItem] = []
+    # Pass back as after_id for the next page; None on the last page
+    next_after_id: Optional[int] = None
+
+class UserIdsRequest(BaseModel):
+    user_ids: List[int] = Field(max_length=MAX_USER_BATCH)
+
+class UserRoleChangeResult(BaseModel):
+    user_id: int
+    # promoted, demoted, already_admin, not_admin, not_found, forbidden
+    status: str
+
+class UserRoleChangeResponse(BaseModel):
+    changed: int
+    results: List[UserRoleChangeResult] = []
@@ -1,6 +1,7 @@
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import date
+from typing import List
 
 class UserLogin(BaseModel):
     email: EmailStr
@@ -11,4 +12,17 @@ class ForgotPasswordRequest(BaseModel):
 
 class ChangePasswordRequest(BaseModel):
     token:str
-    password:str
\ No newline at end of file
+    password:str
+
+MAX_USER_BATCH = 1000
+
+class UserTypesRequest(BaseModel):
+    user_ids: List[int] = Field(max_length=MAX_USER_BATCH)
+
+class UserTypeResponse(BaseModel):
+    user_id: int
+    user_type: str
+
+class UserTypesResponse(BaseModel):
+    users: List[UserTypeResponse] = []
+    not_found: List[int] = []
@@ -1,11 +1,13 @@
-from pydantic import BaseModel
-from datetime import datetime
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field
+from datetime import datetime, date
+from typing import Optional, List, Any, Dict, Literal
 
 class RoomBase(BaseModel):
     name: str
     description: Optional[str] = None
     max_members: Optional[int] = 10
+    expires_at: Optional[datetime] = None
+    idle_ttl_minutes: Optional[int] = Field(None, gt=0)
 
 class RoomCreate(RoomBase):
     pass
@@ -15,10 +17,12 @@ class RoomUpdate(BaseModel):
     description: Optional[str] = None
     max_members: Optional[int] = None
     is_active: Optional[bool] = None
+    expires_at: Optional[datetime] = None
+    idle_ttl_minutes: Optional[int] = Field(None, gt=0)
 
 class RoomResponse(RoomBase):
     id: int
-    code: str
+    code: Optional[str] = None
     created_by: int
     created_at: datetime
     is_active: bool
@@ -29,7 +33,7 @@ class RoomResponse(RoomBase):
 class RoomMemberResponse(BaseModel):
     id: int
     user_id: int
-    user_name: str
+    user_name: Optional[str] = None
     user_email: str
     role: str
     joined_at: datetime
@@ -64,10 +68,79 @@ class RoomInviteResponse(BaseModel):
     room_name: str
     invite_url: Optional[str] = None
 
+class RoomJoinsPerDay(BaseModel):
+    day: date
+    joins: int
+
 class RoomStatsResponse(BaseModel):
     room_id: int
     room_name: str
     total_members: int
     max_members: int
+    occupancy: float
     created_at: datetime
-    is_active: bool
\ No newline at end of file
+    is_active: bool
+    joins_per_day: List[RoomJoinsPerDay] = []
+
+class RoomSearchResult(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    code: Optional[str] = None
+    is_active: bool
+    max_members: int
+
+    class Config:
+        from_attributes = True
+
+class RoomSearchResponse(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    results: List[RoomSearchResult] = []
+
+class RoomEventResponse(BaseModel):
+    id: int
+    room_id: int
+    type: str
+    user_id: Optional[int] = None
+    data: Optional[Dict[str, Any]] = None
+    created_at: datetime
+
+class RoomChangesResponse(BaseModel):
+    events: List[RoomEventResponse] = []
+    cursor: int
+    has_more: bool
+    reset: bool
+
+# Bulk membership changes; each target is a user id or an email
+MAX_MEMBER_BATCH_ITEMS = 1000
+
+class MemberTarget(BaseModel):
+    user_id: Optional[int] = None
+    email: Optional[EmailStr] = None
+
+class MemberAdd(MemberTarget):
+    role: Literal["member", "admin"] = "member"
+
+class MemberRoleChange(MemberTarget):
+    role: Literal["member", "admin"]
+
+class RoomMemberBatchRequest(BaseModel):
+    add: List[MemberAdd] = Field(default_factory=list, max_length=MAX_MEMBER_BATCH_ITEMS)
+    remove: List[MemberTarget] = Field(default_factory=list, max_length=MAX_MEMBER_BATCH_ITEMS)
+    set_role: List[MemberRoleChange] = Field(default_factory=list, max_length=MAX_MEMBER_BATCH_ITEMS)
+
+class MemberBatchResult(BaseModel):
+    op: str
+    user_id: Optional[int] = None
+    email: Optional[str] = None
+    # added, removed, updated, unchanged, already_member, not_member,
+    # user_not_found, room_full, forbidden, duplicate, invalid
+    status: str
+
+class RoomMemberBatchResponse(BaseModel):
+    room_id: int
+    member_count: int
+    results: List[MemberBatchResult] = []
@@ -8,6 +8,7 @@ from jwt.exceptions import InvalidTokenError
 from passlib.context import CryptContext
 from pydantic import BaseModel
 import os
+import uuid
 from dotenv import load_dotenv
 
 
@@ -21,20 +22,55 @@ ACCESS_TOKEN_EXPIRATION_MINUTES = 30000
 REFRESH_TOKEN_EXPIRATION_DAYS = 7
 
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def epoch_micros(moment: datetime) -> int:
+    """Exact microseconds since the epoch, the unit of users.tokens_valid_after"""
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
-    expire= datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRATION_MINUTES))
-    to_encode.update({"exp":expire})
+    now = datetime.now(timezone.utc)
+    expire= now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRATION_MINUTES))
+    # iat keeps its fraction (a datetime would be truncated to whole seconds) so a
+    # password change revokes tokens issued earlier in the same second
+    to_encode.update({"exp":expire, "iat":now.timestamp()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def create_refresh_token(data: dict, expires_delta: timedelta | None = None):
+def create_refresh_token(data: dict, expires_delta: timedelta | None = None, family: str | None = None):
+    """
+    Every refresh token gets its own jti. `fam` ties together all tokens rotated
+    from one login, so reuse of an old token can revoke the whole chain.
+    """
     to_encode=data.copy()
-    expire= datetime.now(timezone.utc) + (expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS))
-    to_encode.update({"exp":expire})
+    now = datetime.now(timezone.utc)
+    expire= now + (expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS))
+    to_encode.update({
+        "exp":expire,
+        "iat":now.timestamp(),
+        "jti":uuid.uuid4().hex,
+        "fam":family or uuid.uuid4().hex
+    })
     encoded_jwt= jwt.encode(to_encode, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_token_pair(data: dict, family: str | None = None):
+    """
+    Access + refresh token for one session. Both carry the session id (`fam`), so
+    revoking the family on logout or reuse also rejects the access token.
+    """
+    family = family or uuid.uuid4().hex
+    return create_access_token({**data, "fam": family}), create_refresh_token(data, family=family)
+
+def issued_before_cutoff(payload: dict, tokens_valid_after: int | None):
+    """True if the token was issued before the user's last password change (epoch microseconds)"""
+    if tokens_valid_after is None:
+        return False
+    return round(payload.get("iat", 0) * 1_000_000) < tokens_valid_after
+
 def verify_access_token(token: str):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -8,12 +8,13 @@ from jwt.exceptions import InvalidTokenError
 from passlib.context import CryptContext
 from pydantic import BaseModel
 
-from models.users import User
+from models.users import User, Admin
 from schemas.token import TokenData
-from . import JWTtoken
+from . import JWTtoken, revocation
 
 from sqlalchemy.orm import Session
 from database import get_db
+from services import queries
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 
@@ -34,6 +35,28 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)],
         token_data = TokenData(email=email)
     except InvalidTokenError as err:
         raise credentials_exception
-    user = db.query(User).filter(User.email == email).first()
+    # Session logged out (or caught replaying a refresh token); checked in memory
+    if revocation.is_family_revoked(payload):
+        raise credentials_exception
+    user = queries.get_user_by_email(db, email)
+    # Tokens issued before the user's last password change are no longer valid
+    if user is not None and JWTtoken.issued_before_cutoff(payload, user.tokens_valid_after):
+        raise credentials_exception
+
+    return user
+
+
+def get_current_admin(current_user: User = Depends(get_current_user),
+                      db: Session = Depends(get_db)
+                      ):
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    admin = db.query(Admin).filter(Admin.user_id == current_user.id).first()
+    if not admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
 
-    return user
\ No newline at end of file
+    return current_user
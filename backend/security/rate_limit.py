@@ -0,0 +1,188 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from fastapi import HTTPException, Request, status
+
+from . import JWTtoken
+
+# Limits are "capacity/period_seconds": a bucket holds `capacity` tokens and
+# refills at capacity/period per second. Each one can be overridden with
+# RATE_LIMIT_<ROUTE>_<KEY>, e.g. RATE_LIMIT_LOGIN_EMAIL=10/60, and "0" disables it.
+DEFAULT_LIMITS = {
+    # bcrypt verify per attempt
+    "login": {"ip": "30/60", "email": "5/60"},
+    # one SMTP session per call
+    "forgot_password": {"ip": "10/300", "email": "3/900"},
+    # a DB lookup per guess at the room code
+    "join_room": {"ip": "60/60", "user": "10/60"},
+}
+
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Set when running behind a proxy that overwrites X-Forwarded-For
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+# Shared backend so all workers see the same buckets; unset = per-process buckets
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+
+class Limit:
+    __slots__ = ("capacity", "rate")
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+
+    @classmethod
+    def parse(cls, spec):
+        if not spec or spec.strip() == "0":
+            return None
+        capacity, period = spec.split("/")
+        return cls(float(capacity), float(period))
+
+
+def _load_limits():
+    limits = {}
+    for route, keys in DEFAULT_LIMITS.items():
+        for key, default in keys.items():
+            limit = Limit.parse(os.getenv(f"RATE_LIMIT_{route.upper()}_{key.upper()}", default))
+            if limit is not None:
+                limits[(route, key)] = limit
+    return limits
+
+
+class LocalBucketStore:
+    """
+    Token buckets in this process, as an LRU-bounded map of key -> [tokens, last refill].
+    An evicted key just starts again with a full bucket.
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, limit):
+        """Return 0 if a token was taken, else the seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [limit.capacity, now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / limit.rate
+
+
+# Same algorithm as LocalBucketStore, run atomically in Redis. Returns the wait
+# in milliseconds (0 = allowed). Keys expire once the bucket would be full again.
+_REDIS_TAKE = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return wait
+"""
+
+
+class RedisBucketStore:
+    """Buckets shared across workers. Falls back to the local store if Redis is unreachable."""
+
+    def __init__(self, url, fallback):
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self._take = self._client.register_script(_REDIS_TAKE)
+        self._fallback = fallback
+        self._redis_error = redis.RedisError
+
+    def take(self, key, limit):
+        try:
+            wait_ms = self._take(keys=[f"ratelimit:{key}"], args=[limit.capacity, limit.rate])
+        except self._redis_error:
+            return self._fallback.take(key, limit)
+        return int(wait_ms) / 1000
+
+
+_limits = _load_limits()
+_store = LocalBucketStore()
+if RATE_LIMIT_REDIS_URL:
+    _store = RedisBucketStore(RATE_LIMIT_REDIS_URL, _store)
+
+metrics = {"allowed": 0, "limited": 0}
+
+
+def client_ip(request: Request):
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def check(route: str, **keys):
+    """
+    Take one token from each configured bucket for `route` (e.g. ip=..., email=...),
+    raising 429 with Retry-After as soon as one is empty. Call before any DB or
+    bcrypt work so a rejected request costs a dict lookup.
+    """
+    for key_type, value in keys.items():
+        limit = _limits.get((route, key_type))
+        if limit is None or value is None:
+            continue
+        wait = _store.take(f"{route}:{key_type}:{value}", limit)
+        if wait:
+            metrics["limited"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+    metrics["allowed"] += 1
+
+
+def _token_subject(request: Request):
+    """The user a bearer token belongs to, without touching the database"""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, JWTtoken.SECRET_KEY, algorithms=[JWTtoken.ALGORITHM]).get("sub")
+    except jwt.InvalidTokenError:
+        return None
+
+
+def limit_by_ip_and_user(route: str):
+    """
+    Route dependency for authenticated endpoints. Put it in the decorator's
+    `dependencies=[...]` so it runs before get_current_user queries the user.
+    """
+
+    def dependency(request: Request):
+        check(route, ip=client_ip(request), user=_token_subject(request))
+
+    return dependency
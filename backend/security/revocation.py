@@ -0,0 +1,187 @@
+import asyncio
+import os
+import threading
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.users import RevokedToken
+from . import JWTtoken
+
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+# Full reload (which also drops expired ids from memory) every N syncs
+REVOCATION_RELOAD_EVERY = int(os.getenv("REVOCATION_RELOAD_EVERY", "720"))
+# Rows become visible at commit, which can be later than their revoked_at, so each
+# sync re-reads this much history before the watermark (adds are idempotent)
+SYNC_OVERLAP = timedelta(seconds=30)
+
+FAMILY_PREFIX = "fam:"
+
+
+class RevocationIndex:
+    """
+    In-memory mirror of the revoked families in revoked_tokens, so the family
+    check every authenticated request makes is one hash lookup. Rotated refresh
+    token ids stay in the table only: consume() finds reuse by its primary key.
+    """
+
+    def __init__(self):
+        self._ids = set()
+        self._lock = threading.Lock()
+        self.watermark = datetime(1970, 1, 1)
+
+    def add(self, token_id):
+        with self._lock:
+            self._ids.add(token_id)
+
+    def __contains__(self, token_id):
+        return token_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+_index = RevocationIndex()
+_sync_lock = threading.Lock()
+_pending_lock = threading.Lock()
+# Families revoked on this worker while load() is reading the table, replayed onto the new index
+_pending = None
+
+_IS_FAMILY = RevokedToken.jti.startswith(FAMILY_PREFIX)
+
+
+def _add_local(token_id):
+    with _pending_lock:
+        _index.add(token_id)
+        if _pending is not None:
+            _pending.append(token_id)
+
+
+def is_family_revoked(payload: dict) -> bool:
+    """True if the session this access or refresh token belongs to was logged out or caught replaying"""
+    family = payload.get("fam")
+    return bool(family) and FAMILY_PREFIX + family in _index
+
+
+def _expires_at(payload: dict):
+    return datetime.fromtimestamp(payload["exp"], tz=timezone.utc).replace(tzinfo=None)
+
+
+def _persist(db: Session, token_id, user_id, reason, expires_at) -> bool:
+    """Insert a revocation row; False if it already existed"""
+    try:
+        with db.begin_nested():
+            db.add(RevokedToken(jti=token_id, user_id=user_id, reason=reason, expires_at=expires_at))
+    except IntegrityError:
+        return False
+    return True
+
+
+def consume(db: Session, payload: dict, user_id: int) -> bool:
+    """
+    Mark a refresh token as used (rotated). Returns False if it had already been
+    used — i.e. the token was replayed — in which case the caller should treat it as reuse.
+    The primary key decides, so this holds across workers and concurrent requests.
+    """
+    return _persist(db, payload["jti"], user_id, "rotated", _expires_at(payload))
+
+
+def revoke_family(db: Session, payload: dict, user_id: int, reason: str):
+    """
+    Revoke every access and refresh token issued from the same login as this one.
+    Call on_family_revoked() once the caller has committed.
+    """
+    # Kept until the longest-lived token the session could still hold has expired;
+    # access tokens outlive refresh tokens
+    access_expiry = datetime.utcnow() + timedelta(minutes=JWTtoken.ACCESS_TOKEN_EXPIRATION_MINUTES)
+    _persist(db, FAMILY_PREFIX + payload["fam"], user_id, reason, max(_expires_at(payload), access_expiry))
+
+
+def on_family_revoked(payload: dict):
+    """Apply a committed revoke_family() to this worker's index; other workers pick it up by sync"""
+    _add_local(FAMILY_PREFIX + payload["fam"])
+
+
+def load(db: Session = None):
+    """Rebuild the in-memory index from every unexpired family revocation"""
+    global _index, _pending
+    with _pending_lock:
+        _pending = []
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        fresh = RevocationIndex()
+        now = datetime.utcnow()
+        for token_id, revoked_at in db.execute(
+            select(RevokedToken.jti, RevokedToken.revoked_at).where(_IS_FAMILY, RevokedToken.expires_at > now)
+        ).yield_per(10000):
+            fresh.add(token_id)
+            if revoked_at > fresh.watermark:
+                fresh.watermark = revoked_at
+
+        with _pending_lock:
+            for token_id in _pending:
+                fresh.add(token_id)
+            _index = fresh
+    finally:
+        with _pending_lock:
+            _pending = None
+        if own_session:
+            db.close()
+
+
+def sync(db: Session = None):
+    """Pull family revocations written by other workers since the last sync"""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        rows = db.execute(
+            select(RevokedToken.jti, RevokedToken.revoked_at)
+            .where(_IS_FAMILY, RevokedToken.revoked_at >= _index.watermark - SYNC_OVERLAP)
+        ).all()
+        for token_id, revoked_at in rows:
+            _index.add(token_id)
+            if revoked_at > _index.watermark:
+                _index.watermark = revoked_at
+    finally:
+        if own_session:
+            db.close()
+
+
+def purge_expired(db: Session = None):
+    """Expired tokens fail signature checks anyway, so their revocation rows can go"""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+        db.commit()
+    finally:
+        if own_session:
+            db.close()
+
+
+def _run_cycle(cycle):
+    with _sync_lock:
+        if cycle % REVOCATION_RELOAD_EVERY == 0:
+            purge_expired()
+            load()
+        else:
+            sync()
+
+
+async def run_sync_scheduler():
+    """Background loop started from the app lifespan; the first cycle does the startup load"""
+    cycle = 0
+    while True:
+        try:
+            await asyncio.to_thread(_run_cycle, cycle)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("Revocation index sync failed:", e)
+        cycle += 1
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
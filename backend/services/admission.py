@@ -0,0 +1,139 @@
+import asyncio
+import json
+import math
+import os
+
+
+def _env(group, setting, default):
+    return type(default)(os.getenv(f"ADMISSION_{group.upper()}_{setting}", default))
+
+
+class RouteGroup:
+    """
+    Concurrency limit for one class of routes. Up to `limit` requests run at
+    once, up to `max_queue` more wait at most `queue_timeout` seconds for a
+    slot, and anything beyond that is shed straight away.
+    """
+
+    def __init__(self, name, limit, max_queue, queue_timeout):
+        self.name = name
+        self.limit = _env(name, "LIMIT", limit)
+        self.max_queue = _env(name, "MAX_QUEUE", max_queue)
+        self.queue_timeout = _env(name, "QUEUE_TIMEOUT", float(queue_timeout))
+        self._semaphore = None
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.queue_timeout))
+
+    async def acquire(self):
+        """Return True once a slot is held, False if the request should be shed"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+
+        # Count waiters as well as holders: a request admitted a moment ago may not
+        # have taken its semaphore slot yet
+        if self.active + self.waiting >= self.limit + self.max_queue:
+            self.shed_queue_full += 1
+            return False
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed_timeout += 1
+            return False
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+        }
+
+
+# bcrypt hashing is CPU bound, so that group gets few slots; room reads are cheap
+AUTH_HASHING = RouteGroup("auth_hashing", limit=4, max_queue=16, queue_timeout=2)
+ROOM_WRITES = RouteGroup("room_writes", limit=16, max_queue=64, queue_timeout=5)
+ROOM_READS = RouteGroup("room_reads", limit=32, max_queue=128, queue_timeout=5)
+
+GROUPS = [AUTH_HASHING, ROOM_WRITES, ROOM_READS]
+
+_AUTH_HASHING_PATHS = {
+    "/api/login",
+    "/api/register",
+    "/api/change_password",
+    "/api/auth/google/login",
+}
+
+
+def classify(method, path):
+    if method == "POST" and path in _AUTH_HASHING_PATHS:
+        return AUTH_HASHING
+    if path.startswith("/api/rooms"):
+        return ROOM_READS if method in ("GET", "HEAD") else ROOM_WRITES
+    return None
+
+
+def get_admission_status():
+    return {"groups": [group.snapshot() for group in GROUPS]}
+
+
+class AdmissionControlMiddleware:
+    """Sheds excess load per route group with 503 + Retry-After before it reaches a handler"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        group = classify(scope["method"], scope["path"])
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await group.acquire():
+            await self._shed(group, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            group.release()
+
+    async def _shed(self, group, send):
+        body = json.dumps({"detail": "Server is busy, please retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(group.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,144 @@
+import json
+import os
+import zlib
+from datetime import date, datetime
+from itertools import chain
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # optional; fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+# Bodies smaller than this go out as a plain response; compressing them costs more than it saves
+COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+# Array items encoded per chunk when streaming a large list
+STREAM_CHUNK_ITEMS = 256
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for trusted, already-shaped data (plain dicts/lists/datetimes).
+    Returning it from a handler skips response_model validation, so only use it
+    for payloads built from our own database rows.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _has_large_list(value):
+    if isinstance(value, list):
+        return len(value) > STREAM_CHUNK_ITEMS or any(_has_large_list(item) for item in value)
+    if isinstance(value, dict):
+        return any(isinstance(item, list) and _has_large_list(item) for item in value.values())
+    return False
+
+
+def iter_dumps(content: Any):
+    """
+    Encode `content` as a sequence of byte chunks whose concatenation is the
+    JSON document. Large lists are encoded STREAM_CHUNK_ITEMS items at a time,
+    so the full document never has to exist as one buffer.
+    """
+    if not _has_large_list(content):
+        yield dumps(content)
+    elif isinstance(content, dict):
+        separator = b"{"
+        for key, value in content.items():
+            yield separator + dumps(key) + b":"
+            yield from iter_dumps(value)
+            separator = b","
+        yield b"}"
+    elif any(isinstance(item, (dict, list)) and _has_large_list(item) for item in content):
+        separator = b"["
+        for item in content:
+            yield separator
+            yield from iter_dumps(item)
+            separator = b","
+        yield b"]"
+    else:
+        yield b"["
+        for start in range(0, len(content), STREAM_CHUNK_ITEMS):
+            # Slice's own brackets stripped; chunks after the first lead with a comma
+            encoded = dumps(content[start:start + STREAM_CHUNK_ITEMS])[1:-1]
+            yield encoded if start == 0 else b"," + encoded
+        yield b"]"
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _brotli(chunks):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in chunks:
+        compressed = compressor.process(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.finish()
+
+
+def _pick_encoding(accept_encoding: str):
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def json_response(request: Request, content: Any) -> Response:
+    """
+    Like FastJSONResponse, but once the body passes COMPRESSION_MIN_BYTES it is
+    streamed: encoded chunk by chunk and, if the client accepts it, compressed
+    with brotli or gzip as it goes. Small bodies are sent as a plain response.
+    """
+    chunks = iter_dumps(content)
+    head = []
+    size = 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= COMPRESSION_MIN_BYTES:
+            break
+    else:
+        return Response(b"".join(head), media_type="application/json")
+
+    body = chain(head, chunks)
+    encoding = _pick_encoding(request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding == "br":
+        body = _brotli(body)
+    elif encoding == "gzip":
+        body = _gzip(body)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(body, media_type="application/json", headers=headers)
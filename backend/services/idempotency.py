@@ -0,0 +1,176 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Response, status
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+# How long a retry waits for the original request to finish before getting a 409.
+# Sync handlers wait on a threadpool thread, so keep this short.
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "2"))
+MAX_KEY_LENGTH = 255
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+class _Record:
+    __slots__ = ("fingerprint", "created_at", "done", "result", "error", "abandoned")
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.created_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+
+class IdempotencyStore:
+    """
+    Bounded, TTL'd map of idempotency key -> first outcome. Oldest keys are
+    evicted first once max_keys is reached; in-flight keys are never evicted.
+    """
+
+    def __init__(self, max_keys=IDEMPOTENCY_MAX_KEYS, ttl_seconds=IDEMPOTENCY_TTL_SECONDS):
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Keys are in insertion order, so only the oldest ones need looking at
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            expired = now - record.created_at > self.ttl_seconds
+            if not expired and len(self._records) <= self.max_keys:
+                break
+            if not record.done.is_set():
+                # Oldest key is still running; evict on a later call
+                break
+            del self._records[key]
+
+    def begin(self, key, fingerprint):
+        """Return (record, True) if the caller should run the handler, else the existing record"""
+        with self._lock:
+            now = time.monotonic()
+            record = self._records.get(key)
+            if record is not None and (record.abandoned or now - record.created_at > self.ttl_seconds):
+                del self._records[key]
+                record = None
+            if record is not None:
+                return record, False
+
+            record = _Record(fingerprint)
+            self._records[key] = record
+            self._evict(now)
+            return record, True
+
+    def complete(self, key, record, result=None, error=None):
+        record.result = result
+        record.error = error
+        record.done.set()
+
+    def abandon(self, key, record):
+        """The handler crashed; drop the key so a retry runs it again"""
+        with self._lock:
+            if self._records.get(key) is record:
+                del self._records[key]
+            record.abandoned = True
+        record.done.set()
+
+    def __len__(self):
+        return len(self._records)
+
+
+store = IdempotencyStore()
+
+
+def _check_key(idempotency_key):
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"
+        )
+
+
+def _replay(record, fingerprint, response):
+    if record.fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used with a different request"
+        )
+    if response is not None:
+        response.headers[REPLAY_HEADER] = "true"
+    if record.error is not None:
+        raise record.error
+    return record.result
+
+
+def _wait_timeout():
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still in progress"
+    )
+
+
+def run_idempotent(scope, idempotency_key, fingerprint, handler, response: Response = None):
+    """
+    Run handler() once per (scope, idempotency_key). Retries get the first
+    result (or HTTPException) back without running the handler; concurrent
+    duplicates block until the first request finishes. No key means no caching.
+    """
+    if not idempotency_key:
+        return handler()
+    _check_key(idempotency_key)
+    key = (scope, idempotency_key)
+
+    while True:
+        record, owner = store.begin(key, fingerprint)
+        if owner:
+            break
+        if not record.done.wait(IDEMPOTENCY_WAIT_SECONDS):
+            raise _wait_timeout()
+        if not record.abandoned:
+            return _replay(record, fingerprint, response)
+
+    try:
+        result = handler()
+    except HTTPException as e:
+        store.complete(key, record, error=e)
+        raise
+    except BaseException:
+        store.abandon(key, record)
+        raise
+    store.complete(key, record, result=result)
+    return result
+
+
+async def run_idempotent_async(scope, idempotency_key, fingerprint, handler, response: Response = None):
+    """Same as run_idempotent for async handlers; waits without blocking the event loop"""
+    if not idempotency_key:
+        return await handler()
+    _check_key(idempotency_key)
+    key = (scope, idempotency_key)
+
+    while True:
+        record, owner = store.begin(key, fingerprint)
+        if owner:
+            break
+        if not await asyncio.to_thread(record.done.wait, IDEMPOTENCY_WAIT_SECONDS):
+            raise _wait_timeout()
+        if not record.abandoned:
+            return _replay(record, fingerprint, response)
+
+    try:
+        result = await handler()
+    except HTTPException as e:
+        store.complete(key, record, error=e)
+        raise
+    except BaseException:
+        store.abandon(key, record)
+        raise
+    store.complete(key, record, result=result)
+    return result
@@ -0,0 +1,248 @@
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from fastapi.routing import APIRoute
+from starlette.routing import Match
+
+# Stdlib sampling profiler for live workers. A daemon thread wakes every
+# interval, reads every thread's current stack with sys._current_frames() and
+# counts it as one collapsed line ("root;caller;...;leaf count"), the input
+# format of flamegraph.pl / speedscope. The profiled code runs untouched, so
+# the cost is one stack walk per thread per interval, on the sampler thread.
+#
+# Stacks are attributed to a route by finding the endpoint function's frame in
+# them, and get "GET /api/rooms/rooms/{room_id}"-style roots. Async endpoints
+# only appear while actually running on the event loop, not while awaiting.
+
+PROFILE_DEFAULT_INTERVAL_MS = float(os.getenv("PROFILE_DEFAULT_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+NO_ROUTE = "[no route]"
+
+# Leaf frames of threads parked with nothing to do (threadpool workers, the
+# event loop's selector); left out unless include_idle is set
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def route_labels(app):
+    """Endpoint code object -> "METHOD /path/{template}" for every API route"""
+    labels = {}
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            code = getattr(route.endpoint, "__code__", None)
+            if code is not None:
+                labels[code] = f"{','.join(sorted(route.methods))} {route.path}"
+    return labels
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples all threads every `interval` seconds until stopped. With
+    `only_code`, keeps just the stacks that pass through that code object.
+    """
+
+    def __init__(self, labels, interval, include_idle=False, only_code=None, exclude_threads=()):
+        self.labels = labels
+        self.interval = interval
+        self.include_idle = include_idle
+        self.only_code = only_code
+        self.exclude_threads = set(exclude_threads)
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        self.exclude_threads.add(threading.get_ident())
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        self.samples += 1
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in self.exclude_threads:
+                continue
+            leaf = frame.f_code
+            if not self.include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES:
+                continue
+
+            names = []
+            route = None
+            found = self.only_code is None
+            while frame is not None:
+                code = frame.f_code
+                names.append(_frame_name(code))
+                if route is None:
+                    route = self.labels.get(code)
+                if code is self.only_code:
+                    found = True
+                frame = frame.f_back
+            if not found:
+                continue
+
+            names.append(route or NO_ROUTE)
+            names.reverse()
+            self.stacks[";".join(names)] += 1
+
+
+def collapsed(stacks: Counter) -> str:
+    """Counter of stacks -> collapsed-stack text, heaviest first"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+_profile_lock = threading.Lock()
+
+
+def profile(app, seconds: float, interval: float, include_idle=False):
+    """
+    Sample the whole process for `seconds`. Returns None if another profile is
+    already running. Blocks, so call it off the event loop.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        # The calling thread just sleeps here, so leave it out
+        sampler = StackSampler(
+            route_labels(app), interval, include_idle=include_idle, exclude_threads=[threading.get_ident()]
+        ).start()
+        time.sleep(seconds)
+        return collapsed(sampler.stop()), sampler.samples
+    finally:
+        _profile_lock.release()
+
+
+class RequestProfiler:
+    """
+    Opt-in per-request profiling: every `every`th request to one route is
+    sampled on its own, and the `keep` slowest are retained. Samples come from
+    any thread inside that route's endpoint, so a concurrent unsampled request
+    to the same route can add frames to the profile.
+    """
+
+    def __init__(self, app, route: APIRoute, every: int, keep: int, interval: float):
+        self.route = route
+        self.label = f"{','.join(sorted(route.methods))} {route.path}"
+        self.every = every
+        self.keep = keep
+        self.interval = interval
+        self._labels = route_labels(app)
+        self._seen = itertools.count(1)
+        self._seq = itertools.count()
+        self._slowest = []  # min-heap of (duration, seq, record)
+        self._lock = threading.Lock()
+        self.requests_seen = 0
+        self.requests_profiled = 0
+
+    def should_profile(self, scope):
+        match, _ = self.route.matches(scope)
+        if match != Match.FULL:
+            return False
+        self.requests_seen = next(self._seen)
+        return self.requests_seen % self.every == 0
+
+    def start(self):
+        return StackSampler(
+            self._labels, self.interval, include_idle=True, only_code=self.route.endpoint.__code__
+        ).start()
+
+    def finish(self, sampler, scope, started_at, duration):
+        stacks = sampler.stop()
+        record = {
+            "route": self.label,
+            "path": scope["path"],
+            "started_at": started_at,
+            "duration_ms": duration * 1000,
+            "samples": sum(stacks.values()),
+            "collapsed": collapsed(stacks),
+        }
+        with self._lock:
+            self.requests_profiled += 1
+            entry = (duration, next(self._seq), record)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def snapshot(self):
+        with self._lock:
+            slowest = [record for _, _, record in sorted(self._slowest, key=lambda e: e[0], reverse=True)]
+        return {
+            "route": self.label,
+            "every": self.every,
+            "keep": self.keep,
+            "interval_ms": self.interval * 1000,
+            "requests_seen": self.requests_seen,
+            "requests_profiled": self.requests_profiled,
+            "slowest": slowest,
+        }
+
+
+_request_profiler = None
+
+
+def find_route(app, method: str, path: str):
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path == path and method.upper() in route.methods:
+            return route
+    return None
+
+
+def enable_request_profiling(app, route: APIRoute, every: int, keep: int, interval: float):
+    global _request_profiler
+    _request_profiler = RequestProfiler(app, route, every, keep, interval)
+    return _request_profiler
+
+
+def disable_request_profiling():
+    global _request_profiler
+    _request_profiler = None
+
+
+def get_request_profiler():
+    return _request_profiler
+
+
+class RequestProfilingMiddleware:
+    """Samples 1-in-N requests to the route picked with enable_request_profiling; a no-op otherwise"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = _request_profiler
+        if scope["type"] != "http" or profiler is None or not profiler.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        sampler = profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.finish(sampler, scope, started_at, time.perf_counter() - started)
@@ -0,0 +1,74 @@
+from sqlalchemy import select, func, bindparam
+from sqlalchemy.orm import Session
+
+from models.users import User, Room, RoomMember
+
+# Hot statements built once at import. Each is a fixed statement object with
+# bound parameters, so SQLAlchemy computes its cache key once and every call
+# is a lookup in the engine's compiled cache instead of rebuilding a Query.
+
+_USER_BY_EMAIL = (
+    select(User)
+    .where(User.email == bindparam("email"))
+    .limit(1)
+)
+
+_MEMBERSHIP = (
+    select(RoomMember)
+    .where(RoomMember.room_id == bindparam("room_id"), RoomMember.user_id == bindparam("user_id"))
+    .limit(1)
+)
+
+_MEMBERSHIP_WITH_ROLE = (
+    select(RoomMember)
+    .where(
+        RoomMember.room_id == bindparam("room_id"),
+        RoomMember.user_id == bindparam("user_id"),
+        RoomMember.role.in_(bindparam("roles", expanding=True))
+    )
+    .limit(1)
+)
+
+_ROOM_BY_CODE = (
+    select(Room)
+    .where(Room.code == bindparam("code"), Room.deleted_at.is_(None))
+    .limit(1)
+)
+
+_ROOM_BY_ID = (
+    select(Room)
+    .where(Room.id == bindparam("room_id"), Room.deleted_at.is_(None))
+    .limit(1)
+)
+
+_ROOM_MEMBER_COUNT = (
+    select(func.count(RoomMember.id))
+    .where(RoomMember.room_id == bindparam("room_id"))
+)
+
+
+def get_user_by_email(db: Session, email: str):
+    return db.execute(_USER_BY_EMAIL, {"email": email}).scalar_one_or_none()
+
+
+def get_membership(db: Session, room_id: int, user_id: int, roles=None):
+    """The user's RoomMember row for a room, optionally only if their role is in `roles`"""
+    if roles is None:
+        return db.execute(_MEMBERSHIP, {"room_id": room_id, "user_id": user_id}).scalar_one_or_none()
+    return db.execute(
+        _MEMBERSHIP_WITH_ROLE,
+        {"room_id": room_id, "user_id": user_id, "roles": list(roles)}
+    ).scalar_one_or_none()
+
+
+def get_room(db: Session, room_id: int):
+    """A room by id, or None if it doesn't exist or is soft-deleted"""
+    return db.execute(_ROOM_BY_ID, {"room_id": room_id}).scalar_one_or_none()
+
+
+def get_room_by_code(db: Session, code: str):
+    return db.execute(_ROOM_BY_CODE, {"code": code}).scalar_one_or_none()
+
+
+def count_room_members(db: Session, room_id: int) -> int:
+    return db.execute(_ROOM_MEMBER_COUNT, {"room_id": room_id}).scalar_one()
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.users import Room, RoomEvent
+
+# In-memory map of every live room code, so join-by-code can turn away
+# mistyped and guessed codes, and codes of inactive rooms, without a query.
+#
+# Changes made on this worker are applied as they commit. Changes from other
+# workers (and the expiry sweep) arrive by tailing room_events every
+# ROOM_CODE_SYNC_SECONDS, so they can take that long to show up here. A code
+# missing from the map may belong to a room another worker created since the
+# last sync, so the first miss is confirmed against the database. A code the
+# database confirmed missing is then kept in a short-lived negative cache, and
+# repeats of it get a 404 from memory. Syncing a room that now holds the code
+# clears the entry, and the TTL is never longer than a sync interval, so the
+# lag for new rooms stays within one sync.
+
+ROOM_CODE_SYNC_SECONDS = float(os.getenv("ROOM_CODE_SYNC_SECONDS", "1"))
+# Full reload every N syncs, to repair anything the event tail missed
+ROOM_CODE_RELOAD_EVERY = int(os.getenv("ROOM_CODE_RELOAD_EVERY", "3600"))
+# How long a code the database confirmed missing is answered from memory
+ROOM_CODE_NEGATIVE_TTL = min(float(os.getenv("ROOM_CODE_NEGATIVE_TTL", "1")), ROOM_CODE_SYNC_SECONDS)
+# Bound on cached missing codes, so a guessing client can't grow it without limit
+ROOM_CODE_NEGATIVE_MAX = int(os.getenv("ROOM_CODE_NEGATIVE_MAX", "100000"))
+# Events can commit later than their created_at, so each sync re-reads this much before the watermark
+SYNC_OVERLAP = timedelta(seconds=30)
+
+_ROOM_EVENT_TYPES = ("room_created", "room_updated", "room_deleted")
+
+# Only what room-level events keep current. Idle-TTL expiry moves on every join
+# (no room event), and capacity needs the live count, so both stay with the database.
+CodeEntry = namedtuple("CodeEntry", ["room_id", "is_active"])
+
+_ENTRY_COLUMNS = (Room.id, Room.code, Room.is_active, Room.deleted_at)
+
+
+class CodeIndex:
+    """
+    code -> CodeEntry, plus room id -> code so a room's old code can be dropped,
+    and code -> expiry (monotonic) for codes the database confirmed missing
+    """
+
+    def __init__(self):
+        self.by_code = {}
+        self.by_room = {}
+        self.missing = {}
+        self._lock = threading.Lock()
+
+    def apply(self, room_id, code, is_active, deleted_at):
+        with self._lock:
+            old_code = self.by_room.pop(room_id, None)
+            if old_code is not None and self.by_code.get(old_code, (None,))[0] == room_id:
+                del self.by_code[old_code]
+            if code is not None:
+                self.missing.pop(code, None)
+                if deleted_at is None:
+                    self.by_code[code] = CodeEntry(room_id, bool(is_active))
+                    self.by_room[room_id] = code
+
+    def is_missing(self, code, now):
+        expires = self.missing.get(code)
+        return expires is not None and expires > now
+
+    def add_missing(self, code, now):
+        with self._lock:
+            if code in self.by_code:
+                return
+            if len(self.missing) >= ROOM_CODE_NEGATIVE_MAX:
+                self.missing = {c: expires for c, expires in self.missing.items() if expires > now}
+                if len(self.missing) >= ROOM_CODE_NEGATIVE_MAX:
+                    return
+            self.missing[code] = now + ROOM_CODE_NEGATIVE_TTL
+
+    def drop_expired_missing(self, now):
+        with self._lock:
+            self.missing = {code: expires for code, expires in self.missing.items() if expires > now}
+
+    def remove_room(self, room_id):
+        self.apply(room_id, None, False, None)
+
+
+_index = CodeIndex()
+_ready = False
+_watermark = None
+_sync_lock = threading.Lock()
+
+metrics = {
+    "lookups": 0,
+    # Live code found in the map; the room is then loaded by primary key
+    "hits": 0,
+    # Inactive room's code; answered 400 from memory without a query
+    "inactive_hits": 0,
+    # Code in the negative cache; answered 404 from memory without a query
+    "negative_hits": 0,
+    # Code in neither; confirmed against the database
+    "unmapped": 0,
+    # Unmapped codes the database found after all (room not synced here yet)
+    "late_codes": 0,
+    # Hits where the map pointed at a room that no longer held the code (fell back to the database)
+    "misses": 0,
+    # Map not loaded yet; went straight to the database
+    "bypassed": 0,
+    "loads": 0,
+    "last_load_at": None,
+    "last_sync_at": None,
+}
+
+UNKNOWN = object()
+
+
+def lookup(code: str):
+    """
+    CodeEntry for a code, None if the database recently confirmed no live room
+    has it, or UNKNOWN if the caller has to ask the database (and then report
+    the answer through record_lookup)
+    """
+    metrics["lookups"] += 1
+    if not _ready:
+        metrics["bypassed"] += 1
+        return UNKNOWN
+    entry = _index.by_code.get(code)
+    if entry is not None:
+        metrics["hits" if entry.is_active else "inactive_hits"] += 1
+        return entry
+    if _index.is_missing(code, time.monotonic()):
+        metrics["negative_hits"] += 1
+        return None
+    metrics["unmapped"] += 1
+    return UNKNOWN
+
+
+def record_lookup(code: str, room: Room = None):
+    """What the database returned for a code lookup() answered UNKNOWN for"""
+    if not _ready:
+        return
+    if room is None:
+        _index.add_missing(code, time.monotonic())
+    else:
+        metrics["late_codes"] += 1
+        on_room_changed(room)
+
+
+def record_miss(room: Room = None, code: str = None):
+    """The map was wrong about `code`; correct it from what the database returned"""
+    metrics["misses"] += 1
+    if room is not None:
+        on_room_changed(room)
+    elif code is not None:
+        entry = _index.by_code.get(code)
+        if entry is not None:
+            _index.remove_room(entry.room_id)
+
+
+def on_room_changed(room: Room):
+    """Call after committing a change to a room's code, is_active or deletion"""
+    _index.apply(room.id, room.code, room.is_active, room.deleted_at)
+
+
+def on_room_deleted(room_id: int):
+    _index.remove_room(room_id)
+
+
+def load(db: Session = None):
+    """Rebuild the map from every live room that holds a code"""
+    global _index, _ready, _watermark
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        # Anything committed while this runs is picked up by the next sync
+        started = datetime.utcnow()
+        fresh = CodeIndex()
+        for row in db.execute(
+            select(*_ENTRY_COLUMNS).where(Room.code.is_not(None), Room.deleted_at.is_(None))
+        ).yield_per(10000):
+            fresh.apply(*row)
+        _index = fresh
+        _watermark = started
+        _ready = True
+        metrics["loads"] += 1
+        metrics["last_load_at"] = started
+    finally:
+        if own_session:
+            db.close()
+
+
+def sync(db: Session = None):
+    """Re-read rooms that changed since the last sync, found via room_events"""
+    global _watermark
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        started = datetime.utcnow()
+        room_ids = db.execute(
+            select(RoomEvent.room_id)
+            .where(RoomEvent.created_at >= _watermark - SYNC_OVERLAP, RoomEvent.type.in_(_ROOM_EVENT_TYPES))
+            .distinct()
+        ).scalars().all()
+        if room_ids:
+            rows = {row[0]: row for row in db.execute(select(*_ENTRY_COLUMNS).where(Room.id.in_(room_ids)))}
+            for room_id in room_ids:
+                if room_id in rows:
+                    _index.apply(*rows[room_id])
+                else:
+                    _index.remove_room(room_id)
+        _index.drop_expired_missing(time.monotonic())
+        _watermark = started
+        metrics["last_sync_at"] = started
+    finally:
+        if own_session:
+            db.close()
+
+
+def _run_cycle(cycle):
+    with _sync_lock:
+        # Until a load has succeeded there is no watermark to sync from
+        if not _ready or _watermark is None or cycle % ROOM_CODE_RELOAD_EVERY == 0:
+            load()
+        else:
+            sync()
+
+
+async def run_sync_scheduler():
+    """Background loop started from the app lifespan; the first cycle does the startup load"""
+    cycle = 0
+    while True:
+        try:
+            await asyncio.to_thread(_run_cycle, cycle)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("Room code map sync failed:", e)
+        cycle += 1
+        await asyncio.sleep(ROOM_CODE_SYNC_SECONDS)
+
+
+def get_status():
+    lookups = metrics["lookups"] or 1
+    return {
+        **metrics,
+        "ready": _ready,
+        "codes": len(_index.by_code),
+        "hit_rate": metrics["hits"] / lookups,
+        "miss_rate": metrics["misses"] / lookups,
+        "negative_hit_rate": metrics["negative_hits"] / lookups,
+        "late_code_rate": metrics["late_codes"] / lookups,
+        # Share of lookups answered (404 or 400) without touching the database
+        "answered_from_memory_rate": (metrics["negative_hits"] + metrics["inactive_hits"]) / lookups,
+    }
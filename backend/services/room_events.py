@@ -0,0 +1,199 @@
+import os
+from typing import Optional
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, func, or_, insert, literal
+from sqlalchemy.orm import Session
+
+from models.users import Room, RoomMember, RoomEvent
+
+# Events younger than this are held back so a transaction that took a lower id
+# but committed later than its neighbours can't be skipped by a client's cursor
+ROOM_EVENTS_SETTLE_SECONDS = float(os.getenv("ROOM_EVENTS_SETTLE_SECONDS", "2"))
+ROOM_EVENTS_PAGE_SIZE = int(os.getenv("ROOM_EVENTS_PAGE_SIZE", "500"))
+
+_EVENT_COLUMNS = (
+    RoomEvent.id,
+    RoomEvent.room_id,
+    RoomEvent.type,
+    RoomEvent.user_id,
+    RoomEvent.data,
+    RoomEvent.created_at,
+)
+
+# Every helper below writes through the caller's session and never commits, so
+# events land in the same transaction as the change they describe.
+
+
+def _record(db: Session, room_id: int, type: str, user_id=None, data=None):
+    db.add(RoomEvent(
+        room_id=room_id,
+        type=type,
+        user_id=user_id,
+        data=jsonable_encoder(data) if data is not None else None,
+    ))
+
+
+def _expiry(room: Room):
+    # Idle-TTL rooms move their expiry on every join/leave
+    return {"expires_at": room.expires_at} if room.idle_ttl_minutes else {}
+
+
+def on_room_created(db: Session, room: Room):
+    _record(db, room.id, "room_created", user_id=room.created_by)
+
+
+def on_room_updated(db: Session, room_id: int, changes: dict):
+    if changes:
+        _record(db, room_id, "room_updated", data=changes)
+
+
+def on_room_deleted(db: Session, room_id: int):
+    _record(db, room_id, "room_deleted")
+
+
+def on_member_joined(db: Session, room: Room, member: RoomMember, user):
+    _record(db, room.id, "member_joined", user_id=user.id, data={
+        "member": {
+            "id": member.id,
+            "user_id": user.id,
+            "user_name": user.name,
+            "user_email": user.email,
+            "role": member.role,
+            "joined_at": member.joined_at,
+        },
+        **_expiry(room),
+    })
+
+
+def on_member_left(db: Session, room: Room, member: RoomMember):
+    _record(db, room.id, "member_left", user_id=member.user_id, data={
+        "member_id": member.id,
+        **_expiry(room),
+    })
+
+
+def on_member_role_changed(db: Session, room_id: int, member: RoomMember):
+    _record(db, room_id, "member_role_changed", user_id=member.user_id, data={
+        "member_id": member.id,
+        "role": member.role,
+    })
+
+
+def _record_many(db: Session, events):
+    """Several events as one executemany INSERT"""
+    if events:
+        db.execute(insert(RoomEvent), [
+            {**event, "data": jsonable_encoder(event["data"]), "created_at": datetime.utcnow()}
+            for event in events
+        ])
+
+
+def on_members_added(db: Session, room: Room, members):
+    """`members` are dicts shaped like on_member_joined's payload"""
+    expiry = _expiry(room)
+    _record_many(db, [
+        {"room_id": room.id, "type": "member_joined", "user_id": member["user_id"],
+         "data": {"member": member, **expiry}}
+        for member in members
+    ])
+
+
+def on_members_removed(db: Session, room: Room, members):
+    expiry = _expiry(room)
+    _record_many(db, [
+        {"room_id": room.id, "type": "member_left", "user_id": member.user_id,
+         "data": {"member_id": member.id, **expiry}}
+        for member in members
+    ])
+
+
+def on_members_role_changed(db: Session, room_id: int, members, role: str):
+    _record_many(db, [
+        {"room_id": room_id, "type": "member_role_changed", "user_id": member.user_id,
+         "data": {"member_id": member.id, "role": role}}
+        for member in members
+    ])
+
+
+def record_rooms_expired(db: Session, room_ids):
+    """One room_updated event per still-active room, as a single INSERT ... SELECT"""
+    db.execute(insert(RoomEvent).from_select(
+        ["room_id", "type", "data", "created_at"],
+        select(
+            Room.id,
+            literal("room_updated"),
+            literal({"is_active": False, "code": None}, RoomEvent.data.type),
+            literal(datetime.utcnow()),
+        ).where(Room.id.in_(room_ids), Room.is_active.is_(True))
+    ))
+
+
+def record_members_removed(db: Session, room_id: int, member_ids):
+    """
+    Tell each member of a purged room about the deletion directly (keyed by their
+    user id), since once their membership rows are gone the room's events no
+    longer reach them
+    """
+    db.execute(insert(RoomEvent).from_select(
+        ["room_id", "type", "user_id", "created_at"],
+        select(
+            literal(room_id),
+            literal("room_deleted"),
+            RoomMember.user_id,
+            literal(datetime.utcnow()),
+        ).where(RoomMember.id.in_(member_ids))
+    ))
+
+
+def get_changes(db: Session, user_id: int, since: Optional[int], limit: int = ROOM_EVENTS_PAGE_SIZE):
+    """
+    Events after `since` for rooms the user belongs to, or about the user.
+    `reset` means the cursor is older than what compaction kept (or the client
+    has no cursor yet, since=None): refetch /rooms and continue from the returned cursor.
+    """
+    oldest = db.execute(select(func.min(RoomEvent.id))).scalar()
+    if since is None or (oldest is not None and since < oldest - 1):
+        latest = db.execute(select(func.max(RoomEvent.id))).scalar() or 0
+        return {"events": [], "cursor": latest, "has_more": False, "reset": True}
+
+    # Read up to the newest settled event. Bounding by id (not filtering on
+    # created_at) means the cursor can never step over a younger event.
+    settled = datetime.utcnow() - timedelta(seconds=ROOM_EVENTS_SETTLE_SECONDS)
+    horizon = db.execute(
+        select(RoomEvent.id)
+        .where(RoomEvent.created_at <= settled)
+        .order_by(RoomEvent.created_at.desc(), RoomEvent.id.desc())
+        .limit(1)
+    ).scalar()
+    if horizon is None or horizon <= since:
+        return {"events": [], "cursor": since, "has_more": False, "reset": False}
+
+    my_rooms = select(RoomMember.room_id).where(RoomMember.user_id == user_id)
+    rows = db.execute(
+        select(*_EVENT_COLUMNS)
+        .where(
+            RoomEvent.id > since,
+            RoomEvent.id <= horizon,
+            or_(RoomEvent.room_id.in_(my_rooms), RoomEvent.user_id == user_id),
+        )
+        .order_by(RoomEvent.id)
+        .limit(limit + 1)
+    ).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    events = [
+        {"id": id, "room_id": room_id, "type": type, "user_id": uid, "data": data, "created_at": created_at}
+        for id, room_id, type, uid, data, created_at in rows
+    ]
+
+    return {
+        "events": events,
+        # With nothing more to read, jump to the horizon so the next poll doesn't
+        # re-scan other rooms' events
+        "cursor": events[-1]["id"] if has_more else horizon,
+        "has_more": has_more,
+        "reset": False,
+    }
@@ -0,0 +1,193 @@
+from datetime import datetime
+
+from sqlalchemy import select, insert, update, delete, exists, literal, or_, func
+from sqlalchemy.orm import Session
+
+from models.users import User, Room, RoomMember
+from schemas.room import RoomMemberBatchRequest
+from services import queries, room_stats, room_events
+
+# Bulk add/remove/set-role for POST /rooms/{id}/members:batch. Targets are
+# resolved and checked in memory against two lookups; the changes themselves
+# are at most one DELETE, two UPDATEs and two INSERT ... SELECTs (one per role).
+
+
+def _resolve_users(db: Session, user_ids, emails):
+    """Map user id -> row and email -> row for every target in one query"""
+    if not user_ids and not emails:
+        return {}, {}
+    rows = db.execute(
+        select(User.id, User.email, User.name).where(or_(User.id.in_(user_ids), User.email.in_(emails)))
+    ).all()
+    return {row.id: row for row in rows}, {row.email: row for row in rows}
+
+
+def _load_memberships(db: Session, room_id: int, user_ids):
+    if not user_ids:
+        return {}
+    rows = db.execute(
+        select(RoomMember.id, RoomMember.user_id, RoomMember.role)
+        .where(RoomMember.room_id == room_id, RoomMember.user_id.in_(user_ids))
+    ).all()
+    return {row.user_id: row for row in rows}
+
+
+def _can_manage(caller: RoomMember, role: str):
+    # Admins manage plain members; only the owner can grant, change or remove admins
+    return caller.role == "owner" or role == "member"
+
+
+def apply_member_batch(db: Session, room: Room, caller: RoomMember, batch: RoomMemberBatchRequest):
+    """
+    Apply a batch of membership changes. Every item gets an outcome; items that
+    can't be applied are reported, not raised, and don't block the rest.
+    Returns (results, member_count). The caller commits.
+    """
+    items = (
+        [("remove", target) for target in batch.remove]
+        + [("set_role", target) for target in batch.set_role]
+        + [("add", target) for target in batch.add]
+    )
+    users_by_id, users_by_email = _resolve_users(
+        db,
+        {target.user_id for _, target in items if target.user_id is not None},
+        {target.email for _, target in items if target.email is not None},
+    )
+    memberships = _load_memberships(db, room.id, list(users_by_id))
+
+    results = []
+    seen = set()
+    to_remove = []
+    to_set = {"member": [], "admin": []}
+    to_add = []
+
+    for op, target in items:
+        result = {"op": op, "user_id": target.user_id, "email": target.email, "status": None}
+        results.append(result)
+
+        if (target.user_id is None) == (target.email is None):
+            result["status"] = "invalid"
+            continue
+        user = users_by_id.get(target.user_id) if target.user_id is not None else users_by_email.get(target.email)
+        if user is None:
+            result["status"] = "user_not_found"
+            continue
+        result["user_id"], result["email"] = user.id, user.email
+        if user.id in seen:
+            result["status"] = "duplicate"
+            continue
+        seen.add(user.id)
+
+        member = memberships.get(user.id)
+        if op == "add":
+            if member is not None:
+                result["status"] = "already_member"
+            elif not _can_manage(caller, target.role):
+                result["status"] = "forbidden"
+            else:
+                to_add.append((result, user, target.role))
+            continue
+
+        if member is None:
+            result["status"] = "not_member"
+        elif member.role == "owner" or user.id == caller.user_id or not _can_manage(caller, member.role):
+            result["status"] = "forbidden"
+        elif op == "remove":
+            to_remove.append(member)
+            result["status"] = "removed"
+        elif not _can_manage(caller, target.role):
+            result["status"] = "forbidden"
+        elif member.role == target.role:
+            result["status"] = "unchanged"
+        else:
+            to_set[target.role].append(member)
+            result["status"] = "updated"
+
+    # Capacity is checked once for the whole batch; adds past it are refused in request order
+    member_count = queries.count_room_members(db, room.id) - len(to_remove)
+    available = max(0, room.max_members - member_count)
+    for result, _, _ in to_add[available:]:
+        result["status"] = "room_full"
+    to_add = to_add[:available]
+
+    if to_remove:
+        removed = db.execute(
+            delete(RoomMember).where(
+                RoomMember.room_id == room.id,
+                RoomMember.user_id.in_([member.user_id for member in to_remove]),
+                RoomMember.role != "owner",
+            ),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        room_stats.on_members_left(db, room.id, count=removed)
+        room_events.on_members_removed(db, room, to_remove)
+
+    for role, members in to_set.items():
+        if members:
+            db.execute(
+                update(RoomMember)
+                .where(RoomMember.room_id == room.id, RoomMember.user_id.in_([member.user_id for member in members]))
+                .values(role=role),
+                execution_options={"synchronize_session": False},
+            )
+            room_events.on_members_role_changed(db, room.id, members, role)
+
+    # Rows this batch inserts are told apart from concurrent joins of the same users
+    # by RETURNING where the dialect has it, otherwise by id
+    returning = db.get_bind().dialect.insert_returning
+    max_id_before = None
+    if to_add and not returning:
+        max_id_before = db.execute(select(func.max(RoomMember.id))).scalar() or 0
+
+    added_ids = []
+    inserted = []
+    now = datetime.utcnow()
+    for role in ("member", "admin"):
+        user_ids = [user.id for _, user, user_role in to_add if user_role == role]
+        if not user_ids:
+            continue
+        # The NOT EXISTS keeps a concurrent join from producing a duplicate row
+        statement = insert(RoomMember).from_select(
+            ["room_id", "user_id", "role", "joined_at"],
+            select(literal(room.id), User.id, literal(role), literal(now))
+            .where(
+                User.id.in_(user_ids),
+                ~exists().where(RoomMember.room_id == room.id, RoomMember.user_id == User.id),
+            )
+        )
+        if returning:
+            inserted += db.execute(
+                statement.returning(RoomMember.id, RoomMember.user_id, RoomMember.role, RoomMember.joined_at)
+            ).all()
+        else:
+            db.execute(statement)
+        added_ids.extend(user_ids)
+
+    if added_ids:
+        if not returning:
+            # This batch's rows all have ids above the pre-insert maximum. A concurrent
+            # join's row that beat the NOT EXISTS may too, but it committed after this
+            # transaction's snapshot, which MySQL's default repeatable read keeps it out of
+            inserted = db.execute(
+                select(RoomMember.id, RoomMember.user_id, RoomMember.role, RoomMember.joined_at)
+                .where(
+                    RoomMember.room_id == room.id,
+                    RoomMember.user_id.in_(added_ids),
+                    RoomMember.id > max_id_before,
+                )
+            ).all()
+        inserted_ids = {row.user_id for row in inserted}
+        users = {}
+        for result, user, _ in to_add:
+            users[user.id] = user
+            result["status"] = "added" if user.id in inserted_ids else "already_member"
+        if inserted:
+            room_stats.on_members_joined(db, room.id, count=len(inserted))
+            room_events.on_members_added(db, room, [
+                {"id": member_id, "user_id": user_id, "user_name": users[user_id].name,
+                 "user_email": users[user_id].email, "role": role, "joined_at": joined_at}
+                for member_id, user_id, role, joined_at in inserted
+            ])
+        member_count += len(inserted)
+
+    return results, member_count
@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, update, case, insert, select, exists, literal
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.users import Room, RoomMember, RoomStats, RoomJoinDaily
+
+STATS_REFRESH_SECONDS = int(os.getenv("STATS_REFRESH_SECONDS", "60"))
+STATS_HISTORY_DAYS = 30
+TOP_ROOMS_LIMIT = 10
+
+_summary_cache = {"data": None, "computed_at": 0.0}
+_summary_lock = threading.Lock()
+
+
+def _record_join(db: Session, room_id: int, count: int):
+    """Bump today's join counter for a room, creating the row on first join of the day"""
+    today = datetime.utcnow().date()
+    result = db.execute(
+        update(RoomJoinDaily)
+        .where(RoomJoinDaily.room_id == room_id, RoomJoinDaily.day == today)
+        .values(joins=RoomJoinDaily.joins + count)
+    )
+    if result.rowcount:
+        return
+
+    try:
+        with db.begin_nested():
+            db.add(RoomJoinDaily(room_id=room_id, day=today, joins=count))
+    except IntegrityError:
+        # A concurrent join created today's row first
+        db.execute(
+            update(RoomJoinDaily)
+            .where(RoomJoinDaily.room_id == room_id, RoomJoinDaily.day == today)
+            .values(joins=RoomJoinDaily.joins + count)
+        )
+
+
+def on_room_created(db: Session, room_id: int):
+    db.add(RoomStats(room_id=room_id, member_count=0))
+    db.flush()
+
+
+def on_members_joined(db: Session, room_id: int, count: int = 1):
+    result = db.execute(
+        update(RoomStats)
+        .where(RoomStats.room_id == room_id)
+        .values(member_count=RoomStats.member_count + count, updated_at=datetime.utcnow())
+    )
+    if not result.rowcount:
+        # Room predates the aggregate tables; seed it from the real count
+        ensure_room_stats(db, room_id)
+    _record_join(db, room_id, count)
+
+
+def on_members_left(db: Session, room_id: int, count: int = 1):
+    result = db.execute(
+        update(RoomStats)
+        .where(RoomStats.room_id == room_id)
+        .values(
+            member_count=case(
+                (RoomStats.member_count > count, RoomStats.member_count - count),
+                else_=0,
+            ),
+            updated_at=datetime.utcnow(),
+        )
+    )
+    if not result.rowcount:
+        ensure_room_stats(db, room_id)
+
+
+def ensure_room_stats(db: Session, room_id: int) -> RoomStats:
+    """Return the aggregate row for a room, backfilling it once if it is missing"""
+    stats = db.get(RoomStats, room_id)
+    if stats is None:
+        # The session doesn't autoflush; a just-deleted membership would still be counted
+        db.flush()
+        member_count = db.query(func.count(RoomMember.id)).filter(RoomMember.room_id == room_id).scalar()
+        stats = RoomStats(room_id=room_id, member_count=member_count or 0)
+        db.add(stats)
+        db.flush()
+    return stats
+
+
+def backfill_room_stats(db: Session) -> int:
+    """
+    Seed room_stats for every room that has no row yet (rooms created before the
+    table existed), as one INSERT ... SELECT. Returns the number of rows added.
+    """
+    result = db.execute(insert(RoomStats).from_select(
+        ["room_id", "member_count", "updated_at"],
+        select(Room.id, func.count(RoomMember.id), literal(datetime.utcnow()))
+        .outerjoin(RoomMember, RoomMember.room_id == Room.id)
+        .where(~exists().where(RoomStats.room_id == Room.id))
+        .group_by(Room.id)
+    ))
+    return result.rowcount
+
+
+def get_room_stats(db: Session, room: Room) -> dict:
+    stats = ensure_room_stats(db, room.id)
+    since = datetime.utcnow().date() - timedelta(days=STATS_HISTORY_DAYS)
+    joins = db.query(RoomJoinDaily.day, RoomJoinDaily.joins).filter(
+        RoomJoinDaily.room_id == room.id,
+        RoomJoinDaily.day >= since
+    ).order_by(RoomJoinDaily.day).all()
+
+    return {
+        "room_id": room.id,
+        "room_name": room.name,
+        "total_members": stats.member_count,
+        "max_members": room.max_members,
+        "occupancy": stats.member_count / room.max_members if room.max_members else 0.0,
+        "created_at": room.created_at,
+        "is_active": room.is_active,
+        "joins_per_day": [{"day": day, "joins": count} for day, count in joins],
+    }
+
+
+def _compute_summary(db: Session) -> dict:
+    room_counts = db.query(
+        func.count(Room.id),
+        func.coalesce(func.sum(case((Room.is_active.is_(True), 1), else_=0)), 0),
+    ).filter(Room.deleted_at.is_(None)).one()
+    total_rooms, active_rooms = room_counts
+
+    total_members = db.query(func.coalesce(func.sum(RoomStats.member_count), 0)).join(
+        Room, RoomStats.room_id == Room.id
+    ).filter(Room.deleted_at.is_(None)).scalar()
+
+    top_rooms = db.query(Room, RoomStats.member_count).join(
+        RoomStats, RoomStats.room_id == Room.id
+    ).filter(Room.deleted_at.is_(None)).order_by(RoomStats.member_count.desc()).limit(TOP_ROOMS_LIMIT).all()
+
+    since = datetime.utcnow().date() - timedelta(days=STATS_HISTORY_DAYS)
+    joins = db.query(RoomJoinDaily.day, func.sum(RoomJoinDaily.joins)).filter(
+        RoomJoinDaily.day >= since
+    ).group_by(RoomJoinDaily.day).order_by(RoomJoinDaily.day).all()
+
+    return {
+        "total_rooms": total_rooms,
+        "active_rooms": active_rooms,
+        "inactive_rooms": total_rooms - active_rooms,
+        "total_members": total_members,
+        "average_members_per_room": total_members / total_rooms if total_rooms else 0.0,
+        "top_rooms": [
+            {
+                "room_id": room.id,
+                "room_name": room.name,
+                "total_members": member_count,
+                "max_members": room.max_members,
+                "occupancy": member_count / room.max_members if room.max_members else 0.0,
+                "is_active": room.is_active,
+            }
+            for room, member_count in top_rooms
+        ],
+        "joins_per_day": [{"day": day, "joins": count} for day, count in joins],
+        "generated_at": datetime.utcnow(),
+    }
+
+
+def get_summary(db: Session, force_refresh: bool = False) -> dict:
+    """Site-wide stats, recomputed at most once per STATS_REFRESH_SECONDS"""
+    now = time.monotonic()
+    cached = _summary_cache["data"]
+    if cached is not None and not force_refresh and now - _summary_cache["computed_at"] < STATS_REFRESH_SECONDS:
+        return cached
+
+    with _summary_lock:
+        # Another request may have refreshed while we waited for the lock
+        if not force_refresh and _summary_cache["data"] is not None \
+                and time.monotonic() - _summary_cache["computed_at"] < STATS_REFRESH_SECONDS:
+            return _summary_cache["data"]
+        data = _compute_summary(db)
+        _summary_cache["data"] = data
+        _summary_cache["computed_at"] = time.monotonic()
+        return data
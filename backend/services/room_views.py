@@ -0,0 +1,115 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+from models.users import User, Room, RoomMember
+
+# Lean read path for room payloads: Core selects of just the columns the
+# response needs, shaped straight into dicts for FastJSONResponse. No ORM
+# identity map, no __dict__ copies, no response_model re-validation.
+
+_creator = aliased(User)
+
+# Output key -> column, in response order. "members" and "creator_name" are
+# filled from the member query and the creator join respectively.
+ROOM_FIELDS = {
+    "name": Room.name,
+    "description": Room.description,
+    "max_members": Room.max_members,
+    "expires_at": Room.expires_at,
+    "idle_ttl_minutes": Room.idle_ttl_minutes,
+    "id": Room.id,
+    "code": Room.code,
+    "created_by": Room.created_by,
+    "created_at": Room.created_at,
+    "is_active": Room.is_active,
+    "members": None,
+    "creator_name": _creator.name,
+}
+
+MEMBER_FIELDS = {
+    "id": RoomMember.id,
+    "user_id": RoomMember.user_id,
+    "user_name": User.name,
+    "user_email": User.email,
+    "role": RoomMember.role,
+    "joined_at": RoomMember.joined_at,
+}
+
+_USER_COLUMNS = ("user_name", "user_email")
+
+
+def parse_fields(fields: str = None):
+    """
+    Turn a `fields=` value such as "name,members.user_name,members.role" into
+    (room keys, member keys), both in response order. None selects everything;
+    "members" alone selects every member field. The room id is always included.
+    """
+    if not fields:
+        return tuple(ROOM_FIELDS), tuple(MEMBER_FIELDS)
+
+    room_keys = {"id"}
+    member_keys = set()
+    unknown = []
+    for field in filter(None, (part.strip() for part in fields.split(","))):
+        prefix, _, member_field = field.partition(".")
+        if prefix == "members" and member_field:
+            if member_field in MEMBER_FIELDS:
+                room_keys.add("members")
+                member_keys.add(member_field)
+            else:
+                unknown.append(field)
+        elif field in ROOM_FIELDS:
+            room_keys.add(field)
+        else:
+            unknown.append(field)
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+
+    if "members" in room_keys and not member_keys:
+        member_keys = set(MEMBER_FIELDS)
+    return (
+        tuple(key for key in ROOM_FIELDS if key in room_keys),
+        tuple(key for key in MEMBER_FIELDS if key in member_keys),
+    )
+
+
+def load_rooms_with_members(db: Session, room_ids, fields=None):
+    """
+    Rooms (not soft-deleted) with their members, in at most two queries regardless
+    of room count. `fields` is a parse_fields() result; only those columns are selected.
+    """
+    if not room_ids:
+        return []
+    room_keys, member_keys = fields or parse_fields()
+
+    column_keys = [key for key in room_keys if key not in ("id", "members")]
+    query = select(Room.id, *(ROOM_FIELDS[key] for key in column_keys))
+    if "creator_name" in room_keys:
+        query = query.outerjoin(_creator, _creator.id == Room.created_by)
+    room_rows = db.execute(
+        query.where(Room.id.in_(room_ids), Room.deleted_at.is_(None)).order_by(Room.id)
+    ).all()
+
+    rooms = {}
+    for room_id, *values in room_rows:
+        room = dict.fromkeys(room_keys)
+        room.update(zip(column_keys, values))
+        room["id"] = room_id
+        if "members" in room:
+            room["members"] = []
+        if "creator_name" in room and room["creator_name"] is None:
+            room["creator_name"] = "Unknown"
+        rooms[room_id] = room
+    if not rooms or "members" not in room_keys:
+        return list(rooms.values())
+
+    query = select(RoomMember.room_id, *(MEMBER_FIELDS[key] for key in member_keys))
+    if any(key in _USER_COLUMNS for key in member_keys):
+        query = query.join(User, RoomMember.user_id == User.id)
+    member_rows = db.execute(
+        query.where(RoomMember.room_id.in_(list(rooms))).order_by(RoomMember.room_id, RoomMember.id)
+    ).all()
+    for room_id, *values in member_rows:
+        rooms[room_id]["members"].append(dict(zip(member_keys, values)))
+
+    return list(rooms.values())
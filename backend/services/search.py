@@ -0,0 +1,366 @@
+import asyncio
+import os
+import re
+import threading
+import heapq
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.users import User, Room, RoomEvent
+
+# Writes made on this worker are applied as they commit. Writes from other
+# workers arrive by incremental sync every SEARCH_SYNC_SECONDS: rooms by tailing
+# room_events (as room_codes does), users by users.updated_at.
+SEARCH_SYNC_SECONDS = float(os.getenv("SEARCH_SYNC_SECONDS", "5"))
+# Full rebuild every N syncs, only to repair anything the incremental sync missed
+SEARCH_REBUILD_EVERY = int(os.getenv("SEARCH_REBUILD_EVERY", "8640"))
+# Rows can commit later than their timestamps, so each sync re-reads this much before the watermark
+SYNC_OVERLAP = timedelta(seconds=30)
+
+_ROOM_EVENT_TYPES = ("room_created", "room_updated", "room_deleted")
+
+# Cap on postings scanned for a query's most selective term in index-wide
+# searches, so one- and two-letter queries stay cheap; such results are flagged
+# as truncated. bench/search_latency.py checks the p99 this gives at 1M users.
+MAX_PREFIX_POSTINGS = int(os.getenv("SEARCH_MAX_PREFIX_POSTINGS", "5000"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Field weights: lower ranks first
+FIELD_NAME = 0
+FIELD_EMAIL = 1
+_FIELD_RANKS = 2
+
+# Rank keys carry the doc id in their low bits
+_DOC_ID_BITS = 48
+_DOC_ID_MASK = (1 << _DOC_ID_BITS) - 1
+
+
+def _combine(a, b):
+    """Scores of two terms -> total prefix-only matches * _FIELD_RANKS + best field rank"""
+    return (a // _FIELD_RANKS + b // _FIELD_RANKS) * _FIELD_RANKS + min(a % _FIELD_RANKS, b % _FIELD_RANKS)
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower())
+
+
+class PrefixIndex:
+    """
+    Sorted token list + postings, so a prefix lookup is a bisect followed by a
+    short forward scan. Postings map doc id -> best field rank for that token.
+    """
+
+    def __init__(self):
+        self._tokens = []
+        self._postings = {}
+        self._doc_tokens = {}
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def add(self, doc_id, fields, keep_sorted=True):
+        """
+        fields: iterable of (field_rank, text). Bulk loads pass keep_sorted=False
+        and call finalize() once at the end instead of inserting into the token list.
+        """
+        self.remove(doc_id)
+        doc_tokens = {}
+        for field_rank, text in fields:
+            for token in tokenize(text):
+                if token not in doc_tokens or field_rank < doc_tokens[token]:
+                    doc_tokens[token] = field_rank
+        for token, field_rank in doc_tokens.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                if keep_sorted:
+                    insort(self._tokens, token)
+            postings[doc_id] = field_rank
+        self._doc_tokens[doc_id] = tuple(doc_tokens)
+
+    def finalize(self):
+        self._tokens = sorted(self._postings)
+
+    def remove(self, doc_id):
+        for token in self._doc_tokens.pop(doc_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[token]
+                i = bisect_left(self._tokens, token)
+                if i < len(self._tokens) and self._tokens[i] == token:
+                    del self._tokens[i]
+
+    def _prefix_range(self, term):
+        """Positions [lo, hi) in the sorted token list of tokens starting with term"""
+        lo = bisect_left(self._tokens, term)
+        # Tokens are [a-z0-9], all of which sort below "{"
+        return lo, bisect_left(self._tokens, term + "{", lo)
+
+    def _match_term(self, term):
+        """
+        (doc id -> score, truncated) for docs with a token starting with term, where
+        score = match rank (0 exact, 1 prefix) * _FIELD_RANKS + field rank, lower is
+        better. The exact token sorts first, so the cap only drops prefix-only matches.
+        """
+        matches = {}
+        scanned = 0
+        i, end = self._prefix_range(term)
+        tokens, all_postings = self._tokens, self._postings
+        while i < end and scanned < MAX_PREFIX_POSTINGS:
+            token = tokens[i]
+            base = 0 if token == term else _FIELD_RANKS
+            postings = all_postings[token]
+            scanned += len(postings)
+            for doc_id, field_rank in postings.items():
+                score = base + field_rank
+                best = matches.get(doc_id)
+                if best is None or score < best:
+                    matches[doc_id] = score
+            i += 1
+        return matches, i < end
+
+    def _term_size(self, term, limit):
+        """
+        Postings under tokens starting with term, counted the way _match_term scans
+        them: (count, capped), stopping early once count reaches limit
+        """
+        count = 0
+        i, end = self._prefix_range(term)
+        while i < end and count < limit:
+            count += len(self._postings[self._tokens[i]])
+            i += 1
+        return count, i < end
+
+    def _match_doc(self, terms, doc_id):
+        """Combined score (see _combine) for one doc, or None if a term matches none of its tokens"""
+        tokens = self._doc_tokens.get(doc_id)
+        if not tokens:
+            return None
+        combined = None
+        for term in terms:
+            best = None
+            for token in tokens:
+                if token.startswith(term):
+                    score = (0 if token == term else _FIELD_RANKS) + self._postings[token][doc_id]
+                    if best is None or score < best:
+                        best = score
+            if best is None:
+                return None
+            combined = best if combined is None else _combine(combined, best)
+        return combined
+
+    def search(self, query, limit, offset=0, allowed_ids=None):
+        """
+        Return (total matches, one page of doc ids, truncated) for docs matching every
+        query term as a prefix. With `allowed_ids` only those docs are considered, and
+        they are checked one by one, so the result is always complete. Otherwise the
+        candidates come from the term with the fewest postings and the other terms are
+        checked per doc; only if even that term matches more than MAX_PREFIX_POSTINGS
+        postings is `truncated` set, and the total is then a lower bound.
+        """
+        terms = tokenize(query)
+        truncated = False
+        if not terms:
+            return 0, [], truncated
+
+        if allowed_ids is not None:
+            scores = {}
+            for doc_id in allowed_ids:
+                score = self._match_doc(terms, doc_id)
+                if score is not None:
+                    scores[doc_id] = score
+        else:
+            # Start from the most selective term, so a broad one ("a bob") can't crowd
+            # out the real matches under the cap
+            terms = list(dict.fromkeys(terms))
+            smallest, smallest_size = terms[0], MAX_PREFIX_POSTINGS
+            if len(terms) > 1:
+                for term in terms:
+                    size, capped = self._term_size(term, smallest_size)
+                    if not capped and size < smallest_size:
+                        smallest, smallest_size = term, size
+            scores, truncated = self._match_term(smallest)
+            rest = [term for term in terms if term != smallest]
+            if rest:
+                filtered = {}
+                for doc_id, score in scores.items():
+                    rest_score = self._match_doc(rest, doc_id)
+                    if rest_score is not None:
+                        filtered[doc_id] = _combine(score, rest_score)
+                scores = filtered
+            if not scores:
+                return 0, [], truncated
+
+        # Rank: fewest prefix-only hits (i.e. most exact tokens), then best field, then id,
+        # packed into one int so the page is picked without a Python key function.
+        # Only the requested page is ordered, so broad queries don't sort every match.
+        ranked = heapq.nsmallest(offset + limit, [(score << _DOC_ID_BITS) | doc_id for doc_id, score in scores.items()])
+        return len(scores), [key & _DOC_ID_MASK for key in ranked[offset:]], truncated
+
+
+class SearchIndexes:
+    def __init__(self):
+        self.users = PrefixIndex()
+        self.rooms = PrefixIndex()
+        self.ready = False
+
+
+_indexes = SearchIndexes()
+_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+# Writes made while a rebuild is reading the tables, replayed onto the new indexes
+_pending = None
+_watermark = None
+
+
+def _user_fields(name, email):
+    # Only the local part: domain tokens are shared by nearly every user and would
+    # turn into postings lists as long as the users table
+    return ((FIELD_NAME, name), (FIELD_EMAIL, (email or "").split("@")[0]))
+
+
+def rebuild(db: Session = None):
+    """Build fresh indexes from the database and swap them in"""
+    global _indexes, _pending, _watermark
+    with _lock:
+        _pending = []
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        # Anything committed while this runs is picked up by the next sync
+        started = datetime.utcnow()
+        fresh = SearchIndexes()
+        for user_id, name, email in db.execute(select(User.id, User.name, User.email)).yield_per(10000):
+            fresh.users.add(user_id, _user_fields(name, email), keep_sorted=False)
+        for room_id, name in db.execute(
+            select(Room.id, Room.name).where(Room.deleted_at.is_(None))
+        ).yield_per(10000):
+            fresh.rooms.add(room_id, ((FIELD_NAME, name),), keep_sorted=False)
+        fresh.users.finalize()
+        fresh.rooms.finalize()
+        fresh.ready = True
+
+        with _lock:
+            for apply in _pending:
+                apply(fresh)
+            _indexes = fresh
+        _watermark = started
+    finally:
+        with _lock:
+            _pending = None
+        if own_session:
+            db.close()
+
+
+def sync(db: Session = None):
+    """Re-index users and rooms that changed since the last sync or rebuild"""
+    global _watermark
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        started = datetime.utcnow()
+        since = _watermark - SYNC_OVERLAP
+        users = db.execute(
+            select(User.id, User.name, User.email).where(User.updated_at >= since)
+        ).all()
+        room_ids = db.execute(
+            select(RoomEvent.room_id)
+            .where(RoomEvent.created_at >= since, RoomEvent.type.in_(_ROOM_EVENT_TYPES))
+            .distinct()
+        ).scalars().all()
+        rooms = dict(db.execute(
+            select(Room.id, Room.name).where(Room.id.in_(room_ids), Room.deleted_at.is_(None))
+        ).all()) if room_ids else {}
+
+        def apply(indexes):
+            for user_id, name, email in users:
+                indexes.users.add(user_id, _user_fields(name, email))
+            for room_id in room_ids:
+                if room_id in rooms:
+                    indexes.rooms.add(room_id, ((FIELD_NAME, rooms[room_id]),))
+                else:
+                    indexes.rooms.remove(room_id)
+
+        _write(apply)
+        _watermark = started
+    finally:
+        if own_session:
+            db.close()
+
+
+def _run_cycle(cycle):
+    with _rebuild_lock:
+        if _watermark is None or cycle % SEARCH_REBUILD_EVERY == 0:
+            rebuild()
+        else:
+            sync()
+
+
+def _write(apply):
+    with _lock:
+        apply(_indexes)
+        if _pending is not None:
+            _pending.append(apply)
+
+
+def index_user(user: User):
+    user_id, fields = user.id, _user_fields(user.name, user.email)
+    _write(lambda indexes: indexes.users.add(user_id, fields))
+
+
+def index_room(room: Room):
+    room_id, fields = room.id, ((FIELD_NAME, room.name),)
+    _write(lambda indexes: indexes.rooms.add(room_id, fields))
+
+
+def unindex_room(room_id: int):
+    _write(lambda indexes: indexes.rooms.remove(room_id))
+
+
+def is_ready():
+    return _indexes.ready
+
+
+def _ensure_ready():
+    # The lifespan normally warms the indexes; build them inline if a query beats it
+    if not _indexes.ready:
+        with _rebuild_lock:
+            if not _indexes.ready:
+                rebuild()
+
+
+def search_users(query, limit, offset):
+    _ensure_ready()
+    with _lock:
+        return _indexes.users.search(query, limit, offset)
+
+
+def search_rooms(query, limit, offset, allowed_ids=None):
+    _ensure_ready()
+    with _lock:
+        return _indexes.rooms.search(query, limit, offset, allowed_ids)
+
+
+async def run_sync_scheduler():
+    """Background loop started from the app lifespan; the first cycle does the startup build"""
+    cycle = 0
+    while True:
+        try:
+            await asyncio.to_thread(_run_cycle, cycle)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("Search index sync failed:", e)
+        cycle += 1
+        await asyncio.sleep(SEARCH_SYNC_SECONDS)
@@ -0,0 +1,48 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.users import SchedulerLease
+
+# Unique per process so two workers on the same host don't share a lease
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(db: Session, name: str, ttl_seconds: float, owner: str = WORKER_ID) -> bool:
+    """
+    Try to take (or renew) the named lease. Returns True if this worker holds it.
+    An expired lease can be taken over, so a crashed worker doesn't block the job forever.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+
+    result = db.execute(
+        update(SchedulerLease)
+        .where(
+            SchedulerLease.name == name,
+            (SchedulerLease.owner == owner) | (SchedulerLease.expires_at < now)
+        )
+        .values(owner=owner, expires_at=expires_at)
+    )
+    if result.rowcount:
+        db.commit()
+        return True
+
+    try:
+        db.add(SchedulerLease(name=name, owner=owner, expires_at=expires_at))
+        db.commit()
+        return True
+    except IntegrityError:
+        # Someone else holds a live lease
+        db.rollback()
+        return False
+
+
+def release_lease(db: Session, name: str, owner: str = WORKER_ID):
+    db.execute(delete(SchedulerLease).where(SchedulerLease.name == name, SchedulerLease.owner == owner))
+    db.commit()
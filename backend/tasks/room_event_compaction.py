@@ -0,0 +1,80 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func
+
+from database import SessionLocal
+from models.users import RoomEvent
+from tasks.leases import acquire_lease, release_lease
+
+COMPACTION_ENABLED = os.getenv("ROOM_EVENTS_COMPACTION_ENABLED", "1") == "1"
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("ROOM_EVENTS_COMPACTION_INTERVAL_SECONDS", "600"))
+# Clients whose cursor is older than this get `reset` and refetch their rooms
+ROOM_EVENTS_RETENTION_HOURS = float(os.getenv("ROOM_EVENTS_RETENTION_HOURS", "72"))
+COMPACTION_BATCH_SIZE = int(os.getenv("ROOM_EVENTS_COMPACTION_BATCH_SIZE", "5000"))
+
+LEASE_NAME = "room_event_compaction"
+
+
+def compact_room_events(now: datetime = None) -> int:
+    """
+    Delete events older than the retention window in batches, always keeping the
+    newest event so /changes can still tell a stale cursor from an idle log.
+    Returns the number of events deleted.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(hours=ROOM_EVENTS_RETENTION_HOURS)
+    deleted = 0
+
+    db = SessionLocal()
+    try:
+        if not acquire_lease(db, LEASE_NAME, COMPACTION_INTERVAL_SECONDS * 2):
+            return 0
+
+        newest = db.execute(select(func.max(RoomEvent.id))).scalar()
+        if newest is None:
+            return 0
+
+        while True:
+            # Fetch ids first: MySQL rejects LIMIT inside an IN subquery
+            ids = db.execute(
+                select(RoomEvent.id)
+                .where(RoomEvent.created_at < cutoff, RoomEvent.id < newest)
+                .order_by(RoomEvent.id)
+                .limit(COMPACTION_BATCH_SIZE)
+            ).scalars().all()
+            if ids:
+                db.execute(
+                    delete(RoomEvent).where(RoomEvent.id.in_(ids)),
+                    execution_options={"synchronize_session": False},
+                )
+                db.commit()
+                deleted += len(ids)
+            if len(ids) < COMPACTION_BATCH_SIZE:
+                break
+    finally:
+        db.close()
+
+    return deleted
+
+
+async def run_compaction_scheduler():
+    """Background loop started from the app lifespan"""
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(compact_room_events)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Room event compaction failed:", e)
+            await asyncio.sleep(COMPACTION_INTERVAL_SECONDS)
+    finally:
+        db = SessionLocal()
+        try:
+            release_lease(db, LEASE_NAME)
+        except Exception:
+            pass
+        finally:
+            db.close()
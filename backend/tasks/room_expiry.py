@@ -0,0 +1,79 @@
+import asyncio
+import os
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from database import SessionLocal
+from models.users import Room
+from services import room_events
+from tasks.leases import acquire_lease, release_lease
+
+EXPIRY_ENABLED = os.getenv("ROOM_EXPIRY_ENABLED", "1") == "1"
+EXPIRY_INTERVAL_SECONDS = float(os.getenv("ROOM_EXPIRY_INTERVAL_SECONDS", "60"))
+EXPIRY_BATCH_SIZE = int(os.getenv("ROOM_EXPIRY_BATCH_SIZE", "500"))
+
+LEASE_NAME = "room_expiry_sweep"
+
+
+def sweep_expired_rooms(now: datetime = None) -> int:
+    """
+    Deactivate rooms whose expires_at has passed and release their codes.
+    Only the worker holding the sweep lease does any work; returns the number of rooms expired.
+    """
+    now = now or datetime.utcnow()
+    expired = 0
+
+    db = SessionLocal()
+    try:
+        # Lease outlives one interval so a slow sweep isn't taken over mid-run
+        if not acquire_lease(db, LEASE_NAME, EXPIRY_INTERVAL_SECONDS * 2):
+            return 0
+
+        while True:
+            # Served by ix_rooms_active_expires (is_active, expires_at)
+            room_ids = db.execute(
+                select(Room.id)
+                .where(Room.is_active.is_(True), Room.expires_at <= now)
+                .limit(EXPIRY_BATCH_SIZE)
+            ).scalars().all()
+            if not room_ids:
+                break
+
+            room_events.record_rooms_expired(db, room_ids)
+            db.execute(
+                update(Room)
+                .where(Room.id.in_(room_ids), Room.is_active.is_(True))
+                .values(is_active=False, code=None),
+                execution_options={"synchronize_session": False},
+            )
+            db.commit()
+            expired += len(room_ids)
+
+            if len(room_ids) < EXPIRY_BATCH_SIZE:
+                break
+    finally:
+        db.close()
+
+    return expired
+
+
+async def run_expiry_scheduler():
+    """Background loop started from the app lifespan"""
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(sweep_expired_rooms)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Room expiry sweep failed:", e)
+            await asyncio.sleep(EXPIRY_INTERVAL_SECONDS)
+    finally:
+        db = SessionLocal()
+        try:
+            release_lease(db, LEASE_NAME)
+        except Exception:
+            pass
+        finally:
+            db.close()
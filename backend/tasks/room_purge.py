@@ -0,0 +1,162 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, select, func
+
+from database import SessionLocal
+from models.users import Room, RoomMember
+from services import room_events
+from tasks.leases import acquire_lease, release_lease
+
+PURGE_ENABLED = os.getenv("ROOM_PURGE_ENABLED", "1") == "1"
+PURGE_INTERVAL_SECONDS = float(os.getenv("ROOM_PURGE_INTERVAL_SECONDS", "30"))
+PURGE_BATCH_SIZE = int(os.getenv("ROOM_PURGE_BATCH_SIZE", "500"))
+# Upper bound on batches per run so one huge room can't monopolise the worker
+PURGE_MAX_BATCHES_PER_RUN = int(os.getenv("ROOM_PURGE_MAX_BATCHES_PER_RUN", "100"))
+
+LEASE_NAME = "room_purge"
+# Renewed after every batch, so this only has to outlast one batch plus the sleep between runs
+PURGE_LEASE_SECONDS = max(PURGE_INTERVAL_SECONDS * 2, 60)
+
+_metrics_lock = threading.Lock()
+metrics = {
+    "runs": 0,
+    "rooms_purged": 0,
+    "members_purged": 0,
+    "batches": 0,
+    "errors": 0,
+    "last_run_at": None,
+    "last_run_seconds": 0.0,
+    "last_run_members_per_second": 0.0,
+    "last_error": None,
+}
+
+
+def _purge_room_members(db, room_id: int, budget: int):
+    """Delete a deleted room's members in batches of PURGE_BATCH_SIZE, committing each batch"""
+    members_deleted = 0
+    batches = 0
+    while batches < budget:
+        # Fetch ids first: MySQL rejects LIMIT inside an IN subquery
+        ids = db.execute(
+            select(RoomMember.id).where(RoomMember.room_id == room_id).limit(PURGE_BATCH_SIZE)
+        ).scalars().all()
+        if ids:
+            room_events.record_members_removed(db, room_id, ids)
+            db.execute(
+                delete(RoomMember).where(RoomMember.id.in_(ids)),
+                execution_options={"synchronize_session": False},
+            )
+            db.commit()
+            batches += 1
+            members_deleted += len(ids)
+            if not acquire_lease(db, LEASE_NAME, PURGE_LEASE_SECONDS):
+                # Lost the lease mid-room; whoever holds it now picks the room up
+                return members_deleted, batches, False
+        if len(ids) < PURGE_BATCH_SIZE:
+            return members_deleted, batches, True
+    return members_deleted, batches, False
+
+
+def purge_deleted_rooms() -> dict:
+    """
+    Run one purge pass over soft-deleted rooms, oldest first. Only the worker
+    holding the purge lease does any work, so each member's room_deleted event
+    is recorded once.
+    """
+    started = time.perf_counter()
+    rooms_purged = 0
+    members_purged = 0
+    batches = 0
+
+    db = SessionLocal()
+    try:
+        if not acquire_lease(db, LEASE_NAME, PURGE_LEASE_SECONDS):
+            return {"rooms_purged": 0, "members_purged": 0, "batches": 0}
+
+        room_ids = db.execute(
+            select(Room.id).where(Room.deleted_at.is_not(None)).order_by(Room.deleted_at).limit(PURGE_BATCH_SIZE)
+        ).scalars().all()
+
+        for room_id in room_ids:
+            if batches >= PURGE_MAX_BATCHES_PER_RUN:
+                break
+            deleted, used, finished = _purge_room_members(db, room_id, PURGE_MAX_BATCHES_PER_RUN - batches)
+            members_purged += deleted
+            batches += used
+            if not finished:
+                break
+
+            # Members are gone; room_stats/room_join_daily rows go with the room via ON DELETE CASCADE
+            db.execute(delete(Room).where(Room.id == room_id, Room.deleted_at.is_not(None)))
+            db.commit()
+            rooms_purged += 1
+    except Exception as e:
+        db.rollback()
+        with _metrics_lock:
+            metrics["errors"] += 1
+            metrics["last_error"] = repr(e)
+        raise
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - started
+    with _metrics_lock:
+        metrics["runs"] += 1
+        metrics["rooms_purged"] += rooms_purged
+        metrics["members_purged"] += members_purged
+        metrics["batches"] += batches
+        metrics["last_run_at"] = datetime.utcnow()
+        metrics["last_run_seconds"] = elapsed
+        metrics["last_run_members_per_second"] = members_purged / elapsed if elapsed > 0 else 0.0
+
+    return {"rooms_purged": rooms_purged, "members_purged": members_purged, "batches": batches}
+
+
+def get_purge_status(db) -> dict:
+    backlog_rooms = db.query(func.count(Room.id)).filter(Room.deleted_at.is_not(None)).scalar()
+    backlog_members = db.query(func.count(RoomMember.id)).join(
+        Room, RoomMember.room_id == Room.id
+    ).filter(Room.deleted_at.is_not(None)).scalar()
+
+    with _metrics_lock:
+        snapshot = dict(metrics)
+
+    return {
+        **snapshot,
+        "enabled": PURGE_ENABLED,
+        "interval_seconds": PURGE_INTERVAL_SECONDS,
+        "batch_size": PURGE_BATCH_SIZE,
+        "backlog_rooms": backlog_rooms,
+        "backlog_members": backlog_members,
+    }
+
+
+async def run_purge_worker():
+    """Background loop started from the app lifespan"""
+    try:
+        while True:
+            try:
+                result = await asyncio.to_thread(purge_deleted_rooms)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Room purge failed:", e)
+                result = None
+
+            # Keep draining without sleeping while there is a backlog
+            if result and result["batches"] >= PURGE_MAX_BATCHES_PER_RUN:
+                await asyncio.sleep(0)
+                continue
+            await asyncio.sleep(PURGE_INTERVAL_SECONDS)
+    finally:
+        db = SessionLocal()
+        try:
+            release_lease(db, LEASE_NAME)
+        except Exception:
+            pass
+        finally:
+            db.close()
@@ -0,0 +1,77 @@
+"""
+Cold-start budget for a worker: `import main` and the first request after
+startup, each measured in a fresh interpreter. Run from backend/ with
+`python -m pytest tests`. Budgets can be raised per machine via
+STARTUP_IMPORT_BUDGET_SECONDS / STARTUP_FIRST_REQUEST_BUDGET_SECONDS.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("STARTUP_IMPORT_BUDGET_SECONDS", "2"))
+FIRST_REQUEST_BUDGET_SECONDS = float(os.getenv("STARTUP_FIRST_REQUEST_BUDGET_SECONDS", "4"))
+
+# Only needed by a few endpoints; importing main must not pull them in
+HEAVY_MODULES = ("pandas", "PIL", "fastapi_mail", "google.oauth2")
+
+_PROBE = """
+import json, sys, time
+from fastapi.testclient import TestClient
+
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+heavy = [name for name in %r if name in sys.modules]
+
+with TestClient(main.app) as client:
+    status = client.get("/api/rooms/rooms").status_code
+    first_request = time.perf_counter()
+
+print(json.dumps({
+    "import_seconds": imported - started,
+    "first_request_seconds": first_request - started,
+    "status": status,
+    "heavy_modules": heavy,
+}))
+""" % (HEAVY_MODULES,)
+
+
+@pytest.fixture(scope="module")
+def startup(tmp_path_factory):
+    db_path = tmp_path_factory.mktemp("startup") / "startup.db"
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "JWTSECRET": os.getenv("JWTSECRET", "startup-test"),
+        "REFRESHJWTSECRET": os.getenv("REFRESHJWTSECRET", "startup-test-refresh"),
+        "PYTHONPATH": str(BACKEND_DIR),
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"\nimport {report['import_seconds'] * 1000:.0f} ms, "
+          f"first request {report['first_request_seconds'] * 1000:.0f} ms")
+    return report
+
+
+def test_import_does_not_load_heavy_dependencies(startup):
+    assert startup["heavy_modules"] == []
+
+
+def test_import_time_within_budget(startup):
+    assert startup["import_seconds"] < IMPORT_BUDGET_SECONDS
+
+
+def test_first_request_within_budget(startup):
+    # Unauthenticated, so this is routing plus the lifespan's schema bootstrap
+    assert startup["status"] == 401
+    assert startup["first_request_seconds"] < FIRST_REQUEST_BUDGET_SECONDS
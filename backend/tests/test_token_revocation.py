@@ -0,0 +1,116 @@
+"""
+Refresh-token rotation, reuse detection, logout and the password-change cutoff,
+exercised through the HTTP endpoints against a throwaway SQLite database. Run
+from backend/ with `python -m pytest tests`.
+"""
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "revocation.db")
+os.environ.setdefault("JWTSECRET", "revocation-test")
+os.environ.setdefault("REFRESHJWTSECRET", "revocation-test-refresh")
+# Every test logs in more than the per-email limit allows in a minute
+os.environ["RATE_LIMIT_LOGIN_EMAIL"] = "0"
+os.environ["RATE_LIMIT_LOGIN_IP"] = "0"
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from passlib.context import CryptContext  # noqa: E402
+
+import main  # noqa: E402
+from database import SessionLocal, create_schema  # noqa: E402
+from models.users import User  # noqa: E402
+from security import revocation  # noqa: E402
+from security.JWTtoken import create_access_token  # noqa: E402
+
+PASSWORD = "correct horse"
+
+
+@pytest.fixture(scope="module")
+def client():
+    create_schema()
+    db = SessionLocal()
+    try:
+        db.add(User(
+            email="rotation@x.com", name="Rotation", role="Verified Email",
+            password=CryptContext(schemes=["bcrypt"], deprecated="auto").hash(PASSWORD),
+        ))
+        db.commit()
+    finally:
+        db.close()
+    # No lifespan: the revocation index is only fed by this worker's own writes
+    return TestClient(main.app)
+
+
+def login(client, password=PASSWORD):
+    response = client.post("/api/login", json={"email": "rotation@x.com", "password": password})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def refresh(client, refresh_token):
+    return client.post("/api/auth/refresh_token", json={"refresh_token": refresh_token})
+
+
+def authed(client, access_token):
+    return client.get("/api/rooms/rooms", headers={"Authorization": f"Bearer {access_token}"})
+
+
+def test_refresh_rotates_the_pair(client):
+    tokens = login(client)
+    response = refresh(client, tokens["refresh_token"])
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert authed(client, rotated["access_token"]).status_code == 200
+    assert refresh(client, rotated["refresh_token"]).status_code == 200
+
+
+def test_reusing_a_rotated_token_revokes_the_family(client):
+    tokens = login(client)
+    rotated = refresh(client, tokens["refresh_token"]).json()
+
+    replay = refresh(client, tokens["refresh_token"])
+    assert replay.status_code == 401
+    assert replay.json()["detail"] == "Refresh token reuse detected"
+
+    # The legitimate holder's newer tokens die with the family
+    assert refresh(client, rotated["refresh_token"]).status_code == 401
+    assert authed(client, rotated["access_token"]).status_code == 401
+    # Other sessions are untouched
+    assert authed(client, login(client)["access_token"]).status_code == 200
+
+
+def test_rotated_ids_are_not_kept_in_memory(client):
+    tokens = login(client)
+    before = len(revocation._index)
+    for _ in range(3):
+        tokens = refresh(client, tokens["refresh_token"]).json()
+    assert len(revocation._index) == before
+
+
+def test_logout_rejects_the_access_token(client):
+    tokens = login(client)
+    assert authed(client, tokens["access_token"]).status_code == 200
+
+    assert client.post("/api/auth/logout", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+    assert authed(client, tokens["access_token"]).status_code == 401
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_password_change_revokes_tokens_issued_the_same_second(client):
+    tokens = login(client)
+    reset_token = create_access_token({"sub": "rotation@x.com"})
+
+    # No sleep: the cutoff has to separate tokens issued within the same second
+    response = client.post("/api/change_password", json={"token": reset_token, "password": "new password"})
+    assert response.status_code == 200, response.text
+
+    assert authed(client, tokens["access_token"]).status_code == 401
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+    # The reset link is single-use
+    assert client.post("/api/change_password", json={"token": reset_token, "password": "again"}).status_code == 401
+
+    fresh = login(client, "new password")
+    assert authed(client, fresh["access_token"]).status_code == 200
+    assert refresh(client, fresh["refresh_token"]).status_code == 200